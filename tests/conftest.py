@@ -1,4 +1,7 @@
 import os
+import tempfile
+
+import pytest
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
@@ -37,3 +40,17 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_storage():
+    from django.test.utils import override_settings
+
+    from core.runner import isolated_caches
+
+    with tempfile.TemporaryDirectory() as directory:
+        media_root = os.path.join(directory, 'media')
+        with isolated_caches(directory), override_settings(
+            MEDIA_ROOT=media_root
+        ):
+            yield
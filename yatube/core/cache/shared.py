@@ -0,0 +1,331 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'YTCACHE1'
+# magic, число слотов, размер слота, логические часы для LRU
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+# занят ли слот, хэш ключа, срок годности (0 — бессрочно),
+# отметка последнего обращения, длины ключа и значения
+SLOT = struct.Struct('<B3x16sdQII')
+EMPTY, USED = 0, 1
+
+
+def check_private(stat_result, is_type, path):
+    """Файл кэша и его каталог должны принадлежать процессу и быть
+    закрыты для остальных: значения читаются через pickle.loads, и
+    подложенный кем-то файл означал бы выполнение чужого кода."""
+    if (
+        not is_type(stat_result.st_mode)
+        or stat_result.st_uid != os.getuid()
+        or stat_result.st_mode & 0o077
+    ):
+        raise ImproperlyConfigured(
+            f'{path} должен принадлежать uid {os.getuid()} '
+            f'и быть доступен только ему'
+        )
+
+
+def same_file(stat_result, path):
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return (current.st_dev, current.st_ino) == (
+        stat_result.st_dev, stat_result.st_ino
+    )
+
+
+class SharedMemoryCache(BaseCache):
+    """Кэш в отображённом в память файле, общий для процессов хоста.
+
+    Файл — хэш-таблица из SLOTS слотов по SLOT_SIZE байт. Ключ
+    занимает один из PROBES слотов подряд, начиная с hash % SLOTS;
+    если свободного среди них нет, вытесняется давнее всего
+    использованный (LRU в пределах окна). Значения больше слота не
+    кэшируются. Доступ сериализуется flock на файл, поэтому кэш
+    корректен между воркерами gunicorn без внешних сервисов.
+
+    Каталог файла создаётся с правами 0700; чужой или доступный другим
+    пользователям файл или каталог не открывается.
+
+        CACHES = {
+            'default': {
+                'BACKEND': 'core.cache.shared.SharedMemoryCache',
+                'LOCATION': '/var/cache/yatube/shared.cache',
+                'OPTIONS': {'SLOTS': 4096, 'SLOT_SIZE': 32768},
+            }
+        }
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.slots = int(options.get('SLOTS', 4096))
+        self.slot_size = int(options.get('SLOT_SIZE', 32768))
+        self.probes = min(int(options.get('PROBES', 8)), self.slots)
+        self._thread_lock = threading.RLock()
+        self._pid = None
+
+    # Файл и блокировки
+
+    def _open(self):
+        # После fork отображение и дескриптор нужно открыть заново.
+        if self._pid == os.getpid():
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, 0o700, exist_ok=True)
+        check_private(os.lstat(directory), stat.S_ISDIR, directory)
+        size = HEADER_SIZE + self.slots * self.slot_size
+        fd = None
+        while fd is None:
+            fd = self._open_file(directory, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    def _open_file(self, directory, size):
+        """Дескриптор файла нужного формата или None, если файл
+        заменили и открыть его нужно заново."""
+        fd = os.open(
+            self.path,
+            os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW | os.O_CLOEXEC,
+            0o600
+        )
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                ready = self._prepare(fd, directory, size)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        except BaseException:
+            os.close(fd)
+            raise
+        if ready:
+            return fd
+        os.close(fd)
+        return None
+
+    def _prepare(self, fd, directory, size):
+        """Проверяет открытый под блокировкой файл; False — файл
+        заменён и его нужно открыть заново."""
+        stat_result = os.fstat(fd)
+        check_private(stat_result, stat.S_ISREG, self.path)
+        if not same_file(stat_result, self.path):
+            # Пока ждали блокировку, файл заменил другой процесс.
+            return False
+        header = HEADER.pack(MAGIC, self.slots, self.slot_size, 0)
+        if os.pread(fd, 16, 0) == header[:16] and stat_result.st_size == size:
+            return True
+        # Файл другого формата или размера может быть отображён в чужом
+        # процессе: ftruncate под ним обернулся бы SIGBUS. Готовим новый
+        # файл рядом и подменяем старый атомарным rename.
+        self._replace(directory, size, header)
+        return False
+
+    def _replace(self, directory, size, header):
+        fd, path = tempfile.mkstemp(dir=directory, prefix='.cache-')
+        try:
+            os.ftruncate(fd, size)
+            os.pwrite(fd, header, 0)
+            os.rename(path, self.path)
+        except BaseException:
+            os.unlink(path)
+            raise
+        finally:
+            os.close(fd)
+
+    def _locked(self, func, *args):
+        with self._thread_lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                return func(*args)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # Работа со слотами (вызывается под блокировкой)
+
+    def _tick(self):
+        magic, slots, slot_size, clock = HEADER.unpack_from(self._map, 0)
+        HEADER.pack_into(self._map, 0, magic, slots, slot_size, clock + 1)
+        return clock + 1
+
+    def _offset(self, index):
+        return HEADER_SIZE + index * self.slot_size
+
+    def _window(self, digest):
+        start = int.from_bytes(digest[:8], 'little') % self.slots
+        return [(start + i) % self.slots for i in range(self.probes)]
+
+    def _find(self, key, digest):
+        """Индекс живого слота с ключом и список слотов окна."""
+        window = self._window(digest)
+        now = time.time()
+        for index in window:
+            offset = self._offset(index)
+            state, slot_digest, expires, _, key_len, _ = SLOT.unpack_from(
+                self._map, offset
+            )
+            if state != USED or slot_digest != digest:
+                continue
+            start = offset + SLOT.size
+            if self._map[start:start + key_len] != key:
+                continue
+            if expires and expires <= now:
+                self._map[offset] = EMPTY
+                return None, window
+            return index, window
+        return None, window
+
+    def _read(self, index):
+        offset = self._offset(index)
+        state, digest, expires, _, key_len, value_len = SLOT.unpack_from(
+            self._map, offset
+        )
+        SLOT.pack_into(
+            self._map, offset, state, digest, expires, self._tick(),
+            key_len, value_len
+        )
+        start = offset + SLOT.size + key_len
+        return pickle.loads(self._map[start:start + value_len])
+
+    def _victim(self, window):
+        """Свободный или просроченный слот окна, иначе давний по LRU."""
+        now = time.time()
+        oldest, oldest_used = None, None
+        for index in window:
+            state, _, expires, used, _, _ = SLOT.unpack_from(
+                self._map, self._offset(index)
+            )
+            if state != USED or (expires and expires <= now):
+                return index
+            if oldest_used is None or used < oldest_used:
+                oldest, oldest_used = index, used
+        return oldest
+
+    def _write(self, index, key, digest, value, expires):
+        offset = self._offset(index)
+        end = offset + SLOT.size + len(key) + len(value)
+        SLOT.pack_into(
+            self._map, offset, USED, digest, expires or 0, self._tick(),
+            len(key), len(value)
+        )
+        self._map[offset + SLOT.size:end] = key + value
+
+    def _store(self, key, value, timeout, only_new):
+        key = key.encode()
+        digest = hashlib.md5(key).digest()
+        index, window = self._find(key, digest)
+        if index is not None and only_new:
+            return False
+        expires = self.get_backend_timeout(timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if SLOT.size + len(key) + len(data) > self.slot_size:
+            if index is not None:
+                self._map[self._offset(index)] = EMPTY
+            return False
+        if index is None:
+            index = self._victim(window)
+        self._write(index, key, digest, data, expires)
+        return True
+
+    def _get(self, key):
+        key = key.encode()
+        index, _ = self._find(key, hashlib.md5(key).digest())
+        return None if index is None else (self._read(index),)
+
+    def _delete(self, key):
+        key = key.encode()
+        index, _ = self._find(key, hashlib.md5(key).digest())
+        if index is None:
+            return False
+        self._map[self._offset(index)] = EMPTY
+        return True
+
+    def _touch(self, key, timeout):
+        key = key.encode()
+        index, _ = self._find(key, hashlib.md5(key).digest())
+        if index is None:
+            return False
+        offset = self._offset(index)
+        fields = list(SLOT.unpack_from(self._map, offset))
+        fields[2] = self.get_backend_timeout(timeout) or 0
+        SLOT.pack_into(self._map, offset, *fields)
+        return True
+
+    def _incr(self, key, delta):
+        key = key.encode()
+        digest = hashlib.md5(key).digest()
+        index, _ = self._find(key, digest)
+        if index is None:
+            raise ValueError("Key '%s' not found" % key.decode())
+        value = self._read(index) + delta
+        expires = SLOT.unpack_from(self._map, self._offset(index))[2]
+        self._write(
+            index, key, digest,
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires
+        )
+        return value
+
+    def _clear(self):
+        for index in range(self.slots):
+            self._map[self._offset(index)] = EMPTY
+
+    # API Django
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._locked(self._store, key, value, timeout, True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._locked(self._store, key, value, timeout, False)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._locked(self._get, key)
+        return default if found is None else found[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._locked(self._touch, key, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._locked(self._delete, key)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._locked(self._incr, key, delta)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._locked(self._get, key) is not None
+
+    def clear(self):
+        self._locked(self._clear)
+
+    def close(self, **kwargs):
+        # Отображение живёт всё время процесса: открытие файла и mmap
+        # на каждый запрос обошлись бы дороже самого кэша.
+        pass
@@ -0,0 +1,240 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+
+class Pickled(bytes):
+    """Сериализованное значение в L1."""
+
+
+def immutable(value):
+    """Можно ли отдавать значение из L1 без копии."""
+    if isinstance(value, tuple):
+        return all(immutable(item) for item in value)
+    return isinstance(value, IMMUTABLE)
+
+
+class TieredCache(BaseCache):
+    """Небольшой LRU в памяти процесса (L1) перед общим кэшем (L2).
+
+    Рядом с каждым значением в L2 лежит штамп: случайная версия,
+    которая меняется при любой записи ключа, и срок годности значения.
+    L1 хранит значение вместе со штампом и сверяет его с L2 не на
+    каждом чтении, а не чаще раза в CHECK_INTERVAL секунд для каждого
+    ключа: запись в другом процессе видна здесь не позже чем через
+    CHECK_INTERVAL, свои записи видны сразу, а записи других ключей
+    копии в L1 не трогают. Между сверками попадание в L1 не стоит ни
+    одного обращения к L2, сверка — чтения короткого штампа.
+
+    Пишущий обновляет сначала значение, потом штамп; читающий берёт
+    сначала штамп, потом значение. Поэтому в L1 не может попасть
+    старое значение с новым штампом. Копия в L1 живёт не дольше
+    значения в L2: срок берётся из штампа.
+
+    Изменяемые значения L1 хранит сериализованными и отдаёт копию, как
+    и остальные бэкенды: иначе, например, закэшированный HttpResponse
+    был бы одним объектом на все запросы процесса.
+
+    Счётчики попаданий копятся в процессе и раз в CHECK_INTERVAL
+    прибавляются к общим в L2, откуда их читает tier_stats().
+
+        CACHES = {
+            'default': {
+                'BACKEND': 'core.cache.tiered.TieredCache',
+                'OPTIONS': {
+                    'L2': 'shared',
+                    'L1_MAX_ENTRIES': 512,
+                    'CHECK_INTERVAL': 1,
+                },
+            },
+            'shared': {...},
+        }
+    """
+    stat_names = ('l1_hits', 'l2_hits', 'misses')
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options['L2']
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 512))
+        self.check_interval = float(options.get('CHECK_INTERVAL', 1))
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._flushed_at = time.monotonic()
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    @staticmethod
+    def stamp_key(key):
+        return f'{key}:stamp'
+
+    def stats_key(self, name):
+        return self.make_key(f'tiered:stats:{name}', version=0)
+
+    # L1
+
+    def _l1_get(self, key):
+        """Запись L1 и нужно ли сверить её штамп с L2."""
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None, False
+            stamp, value, checked_at = entry
+            if stamp[1] is not None and stamp[1] <= time.time():
+                del self._l1[key]
+                return None, False
+            self._l1.move_to_end(key)
+            return entry, time.monotonic() - checked_at >= self.check_interval
+
+    def _l1_set(self, key, stamp, value):
+        if not immutable(value):
+            value = Pickled(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._l1[key] = (stamp, value, time.monotonic())
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_checked(self, key, stamp):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._l1[key] = (stamp, entry[1], time.monotonic())
+
+    def _l1_delete(self, key):
+        with self._lock:
+            self._l1.pop(key, None)
+
+    def _publish(self, key, value, timeout):
+        """Обновляет штамп после записи значения в L2."""
+        stamp = (uuid.uuid4().hex, self.get_backend_timeout(timeout))
+        self.l2.set(self.stamp_key(key), stamp, timeout, version=0)
+        self._l1_set(key, stamp, value)
+
+    # Статистика
+
+    def _count(self, name):
+        now = time.monotonic()
+        with self._lock:
+            self._pending[name] += 1
+            if now - self._flushed_at < self.check_interval:
+                return
+            self._flushed_at = now
+            pending, self._pending = self._pending, Counter()
+        self._flush(pending)
+
+    def _flush(self, pending):
+        for name, count in pending.items():
+            key = self.stats_key(name)
+            if not self.l2.add(key, count, None, version=0):
+                try:
+                    self.l2.incr(key, count, version=0)
+                except ValueError:
+                    self.l2.set(key, count, None, version=0)
+
+    def tier_stats(self):
+        """Попадания в L1, в L2 и промахи всех процессов."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        self._flush(pending)
+        keys = {self.stats_key(name): name for name in self.stat_names}
+        values = self.l2.get_many(keys, version=0)
+        return {name: values.get(key, 0) for key, name in keys.items()}
+
+    # API Django
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        entry, check = self._l1_get(key)
+        stamp = None
+        if check:
+            stamp = self.l2.get(self.stamp_key(key), version=0)
+            if stamp == entry[0]:
+                self._l1_checked(key, stamp)
+            else:
+                entry = None
+        if entry is not None:
+            self._count('l1_hits')
+            if isinstance(entry[1], Pickled):
+                return pickle.loads(entry[1])
+            return entry[1]
+        if not check:
+            stamp = self.l2.get(self.stamp_key(key), version=0)
+        missing = object()
+        value = self.l2.get(key, missing, version=0)
+        if value is missing:
+            self._count('misses')
+            self._l1_delete(key)
+            return default
+        self._count('l2_hits')
+        if stamp is not None:
+            self._l1_set(key, stamp, value)
+        else:
+            self._l1_delete(key)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self._timeout(timeout)
+        self.l2.set(key, value, timeout, version=0)
+        self._publish(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self._timeout(timeout)
+        if not self.l2.add(key, value, timeout, version=0):
+            return False
+        self._publish(key, value, timeout)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self.l2.incr(key, delta, version=0)
+        # Без штампа значение не попадает в L1: счётчики читаются из L2.
+        self.l2.delete(self.stamp_key(key), version=0)
+        self._l1_delete(key)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self._timeout(timeout)
+        # Срок в штампе устарел: без штампа копии в L1 перечитаются.
+        self.l2.delete(self.stamp_key(key), version=0)
+        self._l1_delete(key)
+        return self.l2.touch(key, timeout, version=0)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.l2.delete(key, version=0)
+        self.l2.delete(self.stamp_key(key), version=0)
+        self._l1_delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self.l2.has_key(key, version=0)
+
+    def clear(self):
+        self.l2.clear()
+        with self._lock:
+            self._l1.clear()
+            self._pending.clear()
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
@@ -0,0 +1,101 @@
+import gzip
+import zlib
+
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'image/svg+xml',
+)
+
+
+def accepts_gzip(request):
+    """Принимает ли клиент gzip по Accept-Encoding: явно или через *,
+    с ненулевым q (gzip;q=0 — отказ)."""
+    weights = {}
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for item in header.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+
+def compressible(response):
+    """Имеет ли смысл сжимать ответ: текст, ещё не сжатый, не часть
+    файла. Файлы (FileResponse) отдаются через sendfile() или уже
+    сжаты при collectstatic, поэтому их не трогаем."""
+    return (
+        response.status_code in (200, 404)
+        and not response.has_header('Content-Encoding')
+        and not isinstance(response, FileResponse)
+        and response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+        and (response.streaming
+             or len(response.content) >= settings.GZIP_MIN_LENGTH)
+    )
+
+
+def compress(response):
+    """Сжимает тело ответа gzip с уровнем GZIP_LEVEL, если это имеет
+    смысл и уменьшает тело. Возвращает тот же response."""
+    if not compressible(response):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if response.streaming:
+        response.streaming_content = compress_sequence(
+            response.streaming_content
+        )
+        del response['Content-Length']
+    else:
+        content = gzip.compress(
+            response.content, compresslevel=settings.GZIP_LEVEL, mtime=0
+        )
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = len(content)
+    mark_encoded(response)
+    return response
+
+
+def mark_encoded(response):
+    response['Content-Encoding'] = 'gzip'
+    # Сжатое тело побайтно отличается от исходного: сильный ETag стал
+    # бы врать, слабый по-прежнему годится для 304.
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+
+
+def decompress(response):
+    """Разжимает ответ из кэша для клиента, не принимающего gzip."""
+    if response.get('Content-Encoding') != 'gzip' or response.streaming:
+        return response
+    response.content = gzip.decompress(response.content)
+    response['Content-Length'] = len(response.content)
+    del response['Content-Encoding']
+    return response
+
+
+def compress_sequence(sequence):
+    """Потоковое сжатие: каждый кусок уходит клиенту сразу, не дожидаясь
+    конца ответа."""
+    compressor = zlib.compressobj(
+        settings.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+    )
+    for chunk in sequence:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,40 @@
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('yatube.queries')
+
+
+def query_budget(limit):
+    """Объявляет, сколько запросов к БД может сделать view.
+
+    Бюджет не зависит от числа постов на странице: связанные объекты
+    загружаются пачкой, а не по запросу на строку. Число запросов
+    самой view (вместе с рендерингом шаблона) сохраняется в
+    request.query_count, чтобы тесты сверяли его с view.query_budget;
+    при QUERY_BUDGET_LOG превышение пишется в лог yatube.queries.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            queries = []
+
+            def count(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count):
+                response = view(request, *args, **kwargs)
+            request.query_count = len(queries)
+            if len(queries) > limit and settings.QUERY_BUDGET_LOG:
+                logger.warning(
+                    '%s: %d запросов к БД при бюджете %d',
+                    request.path, len(queries), limit,
+                    extra={'queries': queries},
+                )
+            return response
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
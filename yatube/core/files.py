@@ -0,0 +1,51 @@
+import hashlib
+import os
+from itertools import islice
+
+
+def content_hash(file):
+    """SHA-256 содержимого файла и его размер в байтах.
+
+    Файл читается кусками и перематывается в начало, чтобы его можно
+    было сохранить после подсчёта.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return digest.hexdigest(), size
+
+
+def walk(root, top=''):
+    """Пути файлов под root/top относительно root, через «/».
+
+    Каталоги читаются по одному через os.scandir, поэтому обход не
+    держит в памяти всё дерево и начинает отдавать файлы сразу.
+    """
+    stack = [top]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, directory))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{directory}/{entry.name}' if directory else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry
+
+
+def batched(iterable, size):
+    """Списки по size элементов из iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
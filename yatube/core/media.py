@@ -0,0 +1,188 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, StreamingHttpResponse
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# Имена, в которых есть хэш содержимого: картинки постов (core.storage)
+# и миниатюры sorl.thumbnail. По такому имени всегда отдаётся одно и то
+# же, поэтому браузер может не перепроверять файл.
+HASHED_NAME = re.compile(r'(?:^|/)([0-9a-f]{32,64})\.\w+$')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def serve(request, path):
+    """Отдаёт файл из MEDIA_ROOT с ETag, Last-Modified, Cache-Control
+    и поддержкой запросов части файла (Range).
+
+    Если задан MEDIA_SENDFILE, сам файл отдаёт веб-сервер по заголовку
+    X-Sendfile или X-Accel-Redirect, а Python только проверяет путь и
+    условные заголовки запроса.
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    fullpath, stat_result = find_file(settings.MEDIA_ROOT, name)
+    hashed = HASHED_NAME.search(name)
+    if settings.MEDIA_SENDFILE == 'X-Accel-Redirect':
+        offload = (
+            'X-Accel-Redirect',
+            settings.MEDIA_ACCEL_REDIRECT_LOCATION + quote(name),
+        )
+    elif settings.MEDIA_SENDFILE:
+        offload = (settings.MEDIA_SENDFILE, fullpath)
+    else:
+        offload = None
+    return serve_file(
+        request, fullpath, stat_result,
+        etag=f'"{hashed.group(1)}"' if hashed else None,
+        max_age=IMMUTABLE_MAX_AGE if hashed else settings.MEDIA_CACHE_MAX_AGE,
+        offload=offload,
+    )
+
+
+def find_file(root, name):
+    """Полный путь и stat файла name внутри root или Http404."""
+    try:
+        fullpath = safe_join(root, name)
+        stat_result = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+    return fullpath, stat_result
+
+
+def serve_file(request, fullpath, stat_result, etag=None, max_age=0,
+               content_type=None, offload=None):
+    """Ответ с файлом: условные заголовки, Range и кэширование.
+
+    max_age в год означает неизменяемый файл. offload — пара (заголовок,
+    значение), по которой файл отдаст веб-сервер.
+    """
+    if etag is None:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    last_modified = int(stat_result.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = file_response(
+            request, fullpath, stat_result.st_size, etag,
+            content_type or guess_type(fullpath), offload,
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if max_age >= IMMUTABLE_MAX_AGE:
+        patch_cache_control(
+            response, public=True, max_age=max_age, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+# Тип сжатого файла (app.css.gz) — архив, а не его содержимое: без
+# Content-Encoding браузер не должен принимать его за text/css.
+ENCODED_TYPES = {
+    'gzip': 'application/gzip',
+    'bzip2': 'application/x-bzip2',
+    'xz': 'application/x-xz',
+    'br': 'application/x-brotli',
+    'compress': 'application/x-compress',
+}
+
+
+def guess_type(fullpath):
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    if encoding:
+        return ENCODED_TYPES.get(encoding, 'application/octet-stream')
+    return content_type or 'application/octet-stream'
+
+
+def file_response(request, fullpath, size, etag, content_type, offload):
+    if offload:
+        # Range веб-сервер тоже обработает сам.
+        response = HttpResponse(content_type=content_type)
+        header, value = offload
+        response[header] = value
+        return response
+    try:
+        byte_range = requested_range(request, size, etag)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        # FileResponse отдаёт файл через wsgi.file_wrapper: gunicorn
+        # и uWSGI пишут его в сокет через sendfile(), без копирования.
+        response = FileResponse(
+            open(fullpath, 'rb'), content_type=content_type
+        )
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(fullpath, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def requested_range(request, size, etag):
+    """Границы запрошенной части файла (включительно) или None, если
+    отдавать нужно весь файл.
+
+    Поддерживается один диапазон: на несколько диапазонов и
+    непонятные заголовки, как разрешает RFC 7233, отдаётся весь файл.
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    match = RANGE.match(header)
+    if not match or not any(match.groups()):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        # Файл изменился с тех пор, как клиент получил его начало.
+        return None
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if not suffix or not size:
+            raise RangeNotSatisfiable
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def read_range(fullpath, start, length):
+    with open(fullpath, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
@@ -0,0 +1,91 @@
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404
+from django.utils.cache import patch_vary_headers
+
+from .compression import accepts_gzip, compress, compressible
+from .media import IMMUTABLE_MAX_AGE, find_file, guess_type, serve_file
+
+# Имя, которое дал файлу ManifestStaticFilesStorage: css/app.0123456789ab.css
+HASHED_STATIC_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную в STATIC_ROOT статику без отдельного веб-сервера.
+
+    Файлы с хэшем в имени кэшируются браузером навсегда, остальные —
+    на STATIC_CACHE_MAX_AGE секунд. Клиентам, принимающим gzip,
+    отдаётся заранее сжатый при collectstatic вариант. Файлы, которых
+    нет в STATIC_ROOT, обрабатывает приложение (при DEBUG — staticfiles).
+    """
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT or not settings.STATIC_URL.startswith('/'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+
+    def __call__(self, request):
+        if (
+            request.method in ('GET', 'HEAD')
+            and request.path_info.startswith(self.prefix)
+        ):
+            path = request.path_info[len(self.prefix):]
+            try:
+                return self.serve(request, path)
+            except Http404:
+                pass
+        return self.get_response(request)
+
+    def serve(self, request, path):
+        name = posixpath.normpath(path).lstrip('/')
+        fullpath, stat_result = find_file(settings.STATIC_ROOT, name)
+        if HASHED_STATIC_NAME.search(name):
+            max_age = IMMUTABLE_MAX_AGE
+        else:
+            max_age = settings.STATIC_CACHE_MAX_AGE
+        content_type = guess_type(fullpath)
+        try:
+            compressed = find_file(settings.STATIC_ROOT, name + '.gz')
+        except Http404:
+            return serve_file(
+                request, fullpath, stat_result, max_age=max_age,
+                content_type=content_type,
+            )
+        if accepts_gzip(request):
+            response = serve_file(
+                request, *compressed, max_age=max_age,
+                content_type=content_type,
+            )
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = serve_file(
+                request, fullpath, stat_result, max_age=max_age,
+                content_type=content_type,
+            )
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class CompressionMiddleware:
+    """Сжимает ответы gzip для клиентов, которые его принимают.
+
+    Страницы из кэша (posts.cache.cache_page_by_tags) хранятся уже
+    сжатыми и сюда приходят с Content-Encoding: их повторно не сжимают.
+    Уровень сжатия и минимальный размер тела — GZIP_LEVEL и
+    GZIP_MIN_LENGTH.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if accepts_gzip(request):
+            return compress(response)
+        if compressible(response):
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,34 @@
+import copy
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+SHARED_BACKEND = 'core.cache.shared.SharedMemoryCache'
+
+
+def isolated_caches(directory):
+    """override_settings, переносящий файлы SharedMemoryCache в directory:
+    тесты очищают кэш и не должны трогать кэш работающего сайта."""
+    caches = copy.deepcopy(settings.CACHES)
+    for alias, params in caches.items():
+        if params['BACKEND'] == SHARED_BACKEND:
+            params['LOCATION'] = os.path.join(directory, f'{alias}.cache')
+    return override_settings(CACHES=caches)
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с кэшами во временном каталоге."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.caches = isolated_caches(self.cache_directory.name)
+        self.caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches.disable()
+        self.cache_directory.cleanup()
+        super().teardown_test_environment(**kwargs)
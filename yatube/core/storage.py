@@ -0,0 +1,79 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from .files import content_hash
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под SHA-256 содержимого.
+
+    Файл из upload_to 'posts/' с хэшем abcdef... ляжет в
+    posts/ab/cd/abcdef....gif: два уровня подкаталогов держат каталоги
+    маленькими, а одинаковые загрузки попадают в один файл, который
+    записывается только в первый раз. Удалять такой файл можно, только
+    когда на него никто не ссылается — счёт ссылок ведёт приложение.
+    """
+
+    def hashed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        ).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest, _ = content_hash(content)
+        name = self.hashed_name(name, digest)
+        if self.exists(name):
+            # Свежая дата изменения не даст сборщику мусора удалить файл,
+            # пока новая ссылка на него ещё не записана в БД.
+            os.utime(self.path(name))
+            return name
+        return self._save(name, content)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хэшем содержимого в именах и готовыми .gz рядом.
+
+    collectstatic, кроме копий с хэшем, сжимает текстовые файлы один
+    раз при сборке, а core.middleware.StaticFilesMiddleware отдаёт
+    сжатый вариант тем, кто его принимает. Пока collectstatic не
+    запускали (разработка, тесты), ссылки ведут на исходные имена.
+    """
+    manifest_strict = False
+    compressible = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.map')
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            if name.endswith(self.compressible):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            return
+        if self.exists(name + '.gz'):
+            self.delete(name + '.gz')
+        self._save(name + '.gz', ContentFile(compressed))
@@ -1,4 +1,23 @@
-from django.test import Client, TestCase
+import gzip
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+
+from .cache.shared import SharedMemoryCache
+from .compression import accepts_gzip
+from .middleware import CompressionMiddleware
+from .cache.tiered import TieredCache
+from .decorators import query_budget
 
 
 class ErrorPagesTests(TestCase):
@@ -9,3 +28,433 @@ class ErrorPagesTests(TestCase):
         """URL-адрес использует шаблон posts/index.html."""
         response = self.guest_client.get('/unexisting-page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class MediaServeTests(TestCase):
+    HASHED = 'posts/ab/cd/' + 'ab' * 32 + '.jpg'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        for name in (self.HASHED, 'posts/legacy.jpg'):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'0123456789')
+
+    def get(self, name, **headers):
+        return self.client.get('/media/' + name, **headers)
+
+    def test_file_served_with_validators(self):
+        """Файл отдаётся целиком с ETag и заголовками кэширования."""
+        response = self.get(self.HASHED)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['ETag'], '"' + 'ab' * 32 + '"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        response = self.get('posts/legacy.jpg')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response = self.get(
+            'posts/legacy.jpg', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        """Range отдаёт часть файла, невыполнимый Range — 416."""
+        response = self.get(self.HASHED, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        response = self.get(self.HASHED, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.get(
+            self.HASHED, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.get(self.HASHED, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    @override_settings(MEDIA_SENDFILE='X-Accel-Redirect')
+    def test_sendfile_offload(self):
+        """С MEDIA_SENDFILE файл отдаёт веб-сервер."""
+        response = self.get(self.HASHED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/internal-media/' + self.HASHED
+        )
+        self.assertIn('ETag', response)
+
+    def test_paths_outside_media_root(self):
+        """Каталоги и пути за пределами MEDIA_ROOT не отдаются."""
+        for name in ('posts/', '../settings.py', 'posts/missing.jpg'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'bootstrap.min.css'), 'w') as f:
+            f.write('body { margin: 0; }\n' * 100)
+        override = override_settings(
+            STATIC_ROOT=self.static_root, STATICFILES_DIRS=[source]
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command(
+            'collectstatic', interactive=False, ignore_patterns=['admin'],
+            stdout=StringIO(),
+        )
+
+    def test_hashed_names_and_compressed_copies(self):
+        """collectstatic даёт файлам имена с хэшем и сжимает текстовые,
+        а страницы ссылаются на имена с хэшем."""
+        url = staticfiles_storage.url('css/bootstrap.min.css')
+        self.assertRegex(
+            url, r'^/static/css/bootstrap\.min\.[0-9a-f]{12}\.css$'
+        )
+        name = url[len('/static/'):]
+        self.assertTrue(staticfiles_storage.exists(name + '.gz'))
+        self.assertContains(self.client.get('/'), url)
+
+    def test_middleware_serves_compressed_variant(self):
+        """Сжатый вариант получает только клиент, принимающий gzip;
+        файлы с хэшем в имени кэшируются навсегда."""
+        url = staticfiles_storage.url('css/bootstrap.min.css')
+        with staticfiles_storage.open(url[len('/static/'):]) as file:
+            original = file.read()
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), original
+        )
+
+        response = self.client.get(url)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), original)
+
+        response = self.client.get('/static/css/bootstrap.min.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_middleware_serves_gz_file_as_archive(self):
+        """Прямой запрос сжатого файла отдаёт архив, а не text/css."""
+        url = staticfiles_storage.url('css/bootstrap.min.css') + '.gz'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+
+@override_settings(GZIP_MIN_LENGTH=100, GZIP_LEVEL=9)
+class CompressionMiddlewareTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def respond(self, response, **headers):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(self.factory.get('/', **headers))
+
+    def test_large_text_compressed(self):
+        """Длинный текст сжимается для клиентов с gzip, ETag слабеет."""
+        body = b'<p>compress me</p>' * 50
+        response = HttpResponse(body)
+        response['ETag'] = '"abc"'
+        response = self.respond(response, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), body)
+
+    def test_small_or_unaccepted_not_compressed(self):
+        """Короткие ответы и клиенты без gzip получают тело как есть."""
+        response = self.respond(
+            HttpResponse(b'short'), HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertNotIn('Content-Encoding', response)
+        response = self.respond(HttpResponse(b'x' * 500))
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_accept_encoding_q_values(self):
+        """gzip с q=0 считается отказом, * — согласием."""
+        cases = {
+            'gzip': True,
+            'br;q=1.0, gzip;q=0.8': True,
+            'gzip;q=0': False,
+            'gzip; q=0.0, identity': False,
+            '*': True,
+            '*;q=0': False,
+            'gzip;q=0, *': False,
+            'x-gzip': True,
+            'identity': False,
+            'gzipped': False,
+            '': False,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                request = self.factory.get('/', HTTP_ACCEPT_ENCODING=header)
+                self.assertIs(accepts_gzip(request), expected)
+
+    def test_streaming_compressed_chunk_by_chunk(self):
+        """Потоковый ответ сжимается по кускам, не теряя потоковости."""
+        response = self.respond(
+            StreamingHttpResponse(iter([b'first ' * 10, b'second ' * 10])),
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(
+            gzip.decompress(b''.join(chunks)),
+            b'first ' * 10 + b'second ' * 10,
+        )
+
+
+class SharedMemoryCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.cache')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, **options):
+        options = {'SLOTS': 16, 'SLOT_SIZE': 1024, **options}
+        return SharedMemoryCache(self.path, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        """Кэш поддерживает set/get/add/incr/delete/clear."""
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('counter'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+
+    def test_expiration(self):
+        """Просроченные значения не отдаются."""
+        self.cache.set('short', 'value', 0.05)
+        self.cache.set('forever', 'value', None)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertEqual(self.cache.get('forever'), 'value')
+
+    def test_oversized_value_is_not_stored(self):
+        """Значение больше слота не кэшируется и стирает старое."""
+        self.cache.set('big', 'small')
+        self.cache.set('big', 'x' * 2048)
+        self.assertIsNone(self.cache.get('big'))
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не использованный ключ."""
+        cache = self.make_cache(SLOTS=2, PROBES=2)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+        cache.set('third', 3)
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), 3)
+
+    def test_shared_between_processes(self):
+        """Запись из дочернего процесса видна родителю."""
+        self.cache.get('warm-up')
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.cache.set('from-child', os.getpid())
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(self.cache.get('from-child'), pid)
+        self.assertEqual(self.make_cache().get('from-child'), pid)
+
+    def test_file_is_private(self):
+        """Каталог и файл кэша доступны только владельцу."""
+        self.cache.set('key', 'value')
+        self.assertEqual(
+            os.stat(self.directory.name).st_mode & 0o777, 0o700
+        )
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_foreign_files_are_refused(self):
+        """Ссылку и файл, открытый другим, кэш не открывает."""
+        target = os.path.join(self.directory.name, 'target')
+        open(target, 'wb').close()
+        os.chmod(target, 0o600)
+        os.symlink(target, self.path)
+        with self.assertRaises(OSError):
+            self.cache.get('key')
+        os.unlink(self.path)
+        os.chmod(target, 0o644)
+        os.rename(target, self.path)
+        with self.assertRaises(ImproperlyConfigured):
+            self.make_cache().get('key')
+
+    def test_format_change_replaces_file(self):
+        """Кэш другого формата заменяет файл, а не обрезает открытый."""
+        self.cache.set('key', 'value')
+        inode = os.stat(self.path).st_ino
+        other = self.make_cache(SLOTS=32)
+        self.assertIsNone(other.get('key'))
+        other.set('key', 'other')
+        self.assertNotEqual(os.stat(self.path).st_ino, inode)
+        # Старое отображение осталось целым, обращение к нему не падает.
+        self.assertEqual(self.cache.get('key'), 'value')
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'l2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-tests',
+    },
+})
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        # Два экземпляра с общим L2 ведут себя как два воркера.
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+        self.first.clear()
+
+    def make_cache(self, interval=0):
+        return TieredCache('', {'OPTIONS': {
+            'L2': 'l2', 'L1_MAX_ENTRIES': 2, 'CHECK_INTERVAL': interval,
+        }})
+
+    def test_l1_serves_repeated_reads(self):
+        """Повторное чтение обслуживается L1."""
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(
+            self.second.tier_stats(),
+            {'l1_hits': 1, 'l2_hits': 1, 'misses': 0}
+        )
+
+    def test_write_invalidates_other_l1(self):
+        """Запись в одном процессе сбрасывает L1 другого."""
+        self.first.set('key', 'old')
+        self.second.get('key')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_stamp_is_checked_once_per_interval(self):
+        """Штамп ключа сверяется с L2 не чаще раза в CHECK_INTERVAL, свои
+        записи видны сразу."""
+        second = self.make_cache(interval=0.1)
+        self.first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        self.first.set('key', 'new')
+        with mock.patch.object(second.l2, 'get') as l2_get:
+            self.assertEqual(second.get('key'), 'old')
+        l2_get.assert_not_called()
+        second.set('other', 'own')
+        self.assertEqual(second.get('other'), 'own')
+        time.sleep(0.15)
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_other_writes_keep_l1(self):
+        """Записи других ключей и счётчиков не вытесняют L1."""
+        self.first.set('key', 'value')
+        self.second.get('key')
+        for _ in range(3):
+            self.first.add('metric', 0)
+            self.first.incr('metric')
+            self.first.set('noise', 'x')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.tier_stats()['l1_hits'], 1)
+
+    def test_l1_copy_expires_with_l2(self):
+        """Копия в L1 живёт не дольше значения в L2."""
+        second = self.make_cache(interval=60)
+        self.first.set('short', 'value', 0.05)
+        self.assertEqual(second.get('short'), 'value')
+        time.sleep(0.1)
+        self.assertIsNone(second.get('short'))
+
+    def test_incr_and_add_go_through_l2(self):
+        """add и incr атомарны на уровне L2."""
+        self.assertTrue(self.first.add('counter', 1))
+        self.assertFalse(self.second.add('counter', 5))
+        self.second.get('counter')
+        self.assertEqual(self.first.incr('counter'), 2)
+        self.assertEqual(self.second.get('counter'), 2)
+
+    def test_l1_is_bounded(self):
+        """L1 вытесняет давно использованные ключи."""
+        for key in ('a', 'b', 'c'):
+            self.first.set(key, key)
+        self.assertEqual(list(self.first._l1), [
+            self.first.make_key('b'), self.first.make_key('c')
+        ])
+
+    def test_l1_returns_copies_of_mutable_values(self):
+        """Изменение полученного из L1 объекта не меняет кэш."""
+        self.first.set('list', [1])
+        self.first.get('list').append(2)
+        self.assertEqual(self.first.get('list'), [1])
+        self.assertEqual(self.first.tier_stats()['l1_hits'], 2)
+
+    def test_tier_stats_are_shared(self):
+        """tier_stats складывает счётчики всех процессов."""
+        self.first.set('key', 'value')
+        self.first.get('key')
+        self.second.get('key')
+        self.second.get('missing')
+        for cache in (self.first, self.second):
+            self.assertEqual(
+                cache.tier_stats(),
+                {'l1_hits': 1, 'l2_hits': 1, 'misses': 1}
+            )
+
+
+class QueryBudgetTests(TestCase):
+    @staticmethod
+    @query_budget(1)
+    def view(request):
+        users = get_user_model().objects
+        return HttpResponse(f'{users.count()} {users.exists()}')
+
+    def test_budget_exceeded_is_logged(self):
+        """Превышение бюджета запросов попадает в лог."""
+        request = RequestFactory().get('/budget/')
+        with self.assertLogs('yatube.queries', 'WARNING') as logs:
+            self.view(request)
+        self.assertEqual(request.query_count, 2)
+        self.assertIn('/budget/', logs.output[0])
+
+    @override_settings(QUERY_BUDGET_LOG=False)
+    def test_logging_can_be_disabled(self):
+        """При QUERY_BUDGET_LOG = False запросы только считаются."""
+        request = RequestFactory().get('/budget/')
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('yatube.queries'):
+                self.view(request)
+        self.assertEqual(request.query_count, 2)
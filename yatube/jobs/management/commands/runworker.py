@@ -0,0 +1,120 @@
+import logging
+import signal
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from jobs.queue import claim, execute, prune
+
+logger = logging.getLogger('yatube.jobs')
+
+POOLS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+
+def run_job(job_id, token):
+    try:
+        return execute(job_id, token)
+    finally:
+        # У каждого потока своё соединение: закрываем, чтобы не копить.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет задачи фоновой очереди в пуле потоков или процессов '
+        'и удаляет давно завершённые. Останавливается по SIGINT/SIGTERM, '
+        'дождавшись начатых задач.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.JOBS_WORKER_CONCURRENCY,
+            help='Сколько задач выполнять одновременно.',
+        )
+        parser.add_argument(
+            '--pool',
+            choices=sorted(POOLS),
+            default=settings.JOBS_WORKER_POOL,
+            help='Потоки для задач, ждущих ввода-вывода, процессы — '
+                 'для задач, нагружающих процессор.',
+        )
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            help='Обслуживать только эту очередь (можно повторять).',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и выйти.',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        handlers = {
+            signum: signal.signal(signum, self.stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        concurrency = options['concurrency']
+        # Дочерние процессы не должны делить соединение с родителем.
+        connections.close_all()
+        executor = POOLS[options['pool']](max_workers=concurrency)
+        running = set()
+        done = failed = 0
+        next_prune = time.monotonic()
+        try:
+            while not self.stopping:
+                if time.monotonic() >= next_prune:
+                    prune()
+                    next_prune = (
+                        time.monotonic() + settings.JOBS_PRUNE_INTERVAL
+                    )
+                free = concurrency - len(running)
+                jobs = claim(free, options['queues']) if free else []
+                for job in jobs:
+                    running.add(executor.submit(run_job, job.pk, job.claim))
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(settings.JOBS_POLL_INTERVAL)
+                    continue
+                # Пока задачи находятся и есть свободные места, очередь
+                # опрашивается сразу, иначе — после паузы или по
+                # завершении любой из начатых задач.
+                busy = not jobs or len(running) == concurrency
+                finished, running = wait(
+                    running,
+                    timeout=settings.JOBS_POLL_INTERVAL if busy else 0,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in finished:
+                    done, failed = self.account(future, done, failed)
+        finally:
+            executor.shutdown(wait=True)
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        for future in running:
+            done, failed = self.account(future, done, failed)
+        self.stdout.write(f'Выполнено задач: {done}, с ошибкой: {failed}')
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def account(self, future, done, failed):
+        try:
+            succeeded = future.result()
+        except Exception:
+            logger.exception('Воркер не смог выполнить задачу')
+            succeeded = False
+        return (done + 1, failed) if succeeded else (done, failed + 1)
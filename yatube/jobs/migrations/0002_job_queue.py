@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='jobs_job_ready',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='queue',
+            field=models.CharField(default='default', help_text='Воркер может обслуживать только часть очередей', max_length=50, verbose_name='Очередь'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['queue', 'status', '-priority', 'run_at'], name='jobs_job_queue_ready'),
+        ),
+    ]
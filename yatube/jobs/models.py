@@ -0,0 +1,68 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Задача фоновой очереди.
+
+    Воркер забирает задачу условным UPDATE: статус становится RUNNING,
+    а run_at сдвигается на таймаут видимости. Если воркер не отчитался
+    до этого времени (упал или завис), задачу заберёт другой.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Провалена'),
+    )
+
+    name = models.CharField('Задача', max_length=200)
+    queue = models.CharField(
+        'Очередь',
+        max_length=50,
+        default='default',
+        help_text='Воркер может обслуживать только часть очередей'
+    )
+    payload = models.TextField('Аргументы (JSON)', default='{}')
+    priority = models.SmallIntegerField(
+        'Приоритет',
+        default=0,
+        help_text='Задачи с большим приоритетом выполняются раньше'
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED
+    )
+    run_at = models.DateTimeField(
+        'Выполнить не раньше',
+        default=timezone.now
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Максимум попыток')
+    claim = models.CharField(
+        'Метка воркера',
+        max_length=32,
+        blank=True,
+        editable=False
+    )
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        ordering = ['-priority', 'run_at', 'id']
+        indexes = [
+            models.Index(
+                fields=['queue', 'status', '-priority', 'run_at'],
+                name='jobs_job_queue_ready',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
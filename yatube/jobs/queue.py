@@ -0,0 +1,159 @@
+import json
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('yatube.jobs')
+
+TASKS = {}
+
+
+def task(func=None, *, name=None):
+    """Регистрирует функцию как задачу очереди.
+
+    Аргументы задачи передаются только именованными и должны
+    сериализоваться в JSON: в очереди хранятся id, а не объекты.
+    """
+    def register(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        TASKS[func.task_name] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def enqueue(func, queue='default', priority=0, delay=0, max_attempts=None,
+            **kwargs):
+    """Ставит задачу в очередь.
+
+    Очередь лежит в той же БД, поэтому задача записывается в текущей
+    транзакции: воркер не увидит её раньше данных, которые она читает,
+    а откат транзакции отменит и задачу.
+    """
+    name = getattr(func, 'task_name', func)
+    if name not in TASKS:
+        raise KeyError(f'Задача {name} не зарегистрирована')
+    job = Job(
+        name=name,
+        queue=queue,
+        payload=json.dumps(kwargs),
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+    job.save()
+    return job
+
+
+def claim(limit, queues=None):
+    """Забирает до limit готовых задач из очередей queues (по умолчанию
+    из всех) и возвращает их.
+
+    Кандидаты — задачи в очереди и задачи, чей воркер не отчитался до
+    конца таймаута видимости. Каждую забирает условный UPDATE по
+    прочитанным статусу и run_at: из нескольких воркеров его выполнит
+    только один, без блокировок строк, которых нет в SQLite.
+    """
+    now = timezone.now()
+    Job.objects.filter(
+        status=Job.RUNNING, run_at__lte=now,
+        attempts__gte=F('max_attempts'),
+    ).update(
+        status=Job.FAILED,
+        finished=now,
+        last_error='Воркер не отчитался до конца таймаута видимости',
+    )
+    ready = Job.objects.filter(
+        status__in=(Job.QUEUED, Job.RUNNING), run_at__lte=now
+    )
+    if queues:
+        ready = ready.filter(queue__in=queues)
+    # С запасом: часть кандидатов может забрать другой воркер.
+    candidates = ready.values_list('pk', 'status', 'run_at')[:limit * 2]
+    claimed = []
+    for pk, status, run_at in candidates:
+        token = uuid.uuid4().hex
+        updated = Job.objects.filter(
+            pk=pk, status=status, run_at=run_at
+        ).update(
+            status=Job.RUNNING,
+            run_at=now + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+            attempts=F('attempts') + 1,
+            claim=token,
+        )
+        if updated:
+            claimed.append(Job.objects.get(pk=pk))
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def backoff(attempts):
+    """Пауза перед повтором: экспоненциальная, с верхней границей."""
+    return min(
+        settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOBS_RETRY_BACKOFF_MAX,
+    )
+
+
+def execute(job_id, token):
+    """Выполняет забранную задачу и записывает результат.
+
+    Результат пишется только при совпадении метки: если задачу успели
+    забрать повторно после таймаута видимости, отчёт старого воркера
+    ничего не перезапишет.
+    """
+    job = Job.objects.get(pk=job_id)
+    mine = Job.objects.filter(pk=job_id, claim=token)
+    try:
+        TASKS[job.name](**json.loads(job.payload))
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('%s: попытка %d не удалась\n%s', job, job.attempts,
+                       error)
+        if job.attempts >= job.max_attempts:
+            mine.update(
+                status=Job.FAILED, last_error=error, finished=timezone.now()
+            )
+            return False
+        mine.update(
+            status=Job.QUEUED,
+            last_error=error,
+            run_at=timezone.now() + timedelta(
+                seconds=backoff(job.attempts)
+            ),
+        )
+        return False
+    mine.update(status=Job.DONE, finished=timezone.now())
+    return True
+
+
+def run_pending(limit=100, queues=None):
+    """Выполняет готовые задачи в текущем потоке (тесты, отладка)."""
+    done = 0
+    for job in claim(limit, queues):
+        execute(job.pk, job.claim)
+        done += 1
+    return done
+
+
+def prune():
+    """Удаляет выполненные задачи старше JOBS_KEEP_DONE секунд и
+    проваленные старше JOBS_KEEP_FAILED. Возвращает число удалённых."""
+    now = timezone.now()
+    deleted = 0
+    for status, keep in (
+        (Job.DONE, settings.JOBS_KEEP_DONE),
+        (Job.FAILED, settings.JOBS_KEEP_FAILED),
+    ):
+        count, _ = Job.objects.filter(
+            status=status, finished__lt=now - timedelta(seconds=keep)
+        ).delete()
+        deleted += count
+    return deleted
@@ -0,0 +1,168 @@
+import json
+import re
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Follow, Post, TimelineEntry
+from .models import Job
+from .queue import (
+    backoff, claim, enqueue, execute, prune, run_pending, task
+)
+
+User = get_user_model()
+CALLS = []
+
+
+@task
+def record(value):
+    CALLS.append(value)
+
+
+@task
+def explode():
+    raise RuntimeError('boom')
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_jobs_run_by_priority(self):
+        """Задачи выполняются по убыванию приоритета."""
+        enqueue(record, value='low')
+        enqueue(record, priority=5, value='high')
+        enqueue(record, delay=60, value='later')
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(CALLS, ['high', 'low'])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    @override_settings(JOBS_RETRY_BACKOFF=10, JOBS_RETRY_BACKOFF_MAX=15)
+    def test_failed_job_retried_with_backoff(self):
+        """Упавшая задача откладывается, после всех попыток — FAILED."""
+        job = enqueue(explode, max_attempts=2)
+        with self.assertLogs('yatube.jobs', 'WARNING'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertEqual(backoff(1), 10)
+        self.assertEqual(backoff(3), 15)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('yatube.jobs', 'WARNING'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_visibility_timeout(self):
+        """Задачу молчащего воркера забирает другой, а отчёт старого
+        воркера не перезаписывает результат."""
+        job = enqueue(record, value='once')
+        stale = claim(1)[0]
+        self.assertEqual(claim(1), [])
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        fresh = claim(1)[0]
+        self.assertEqual(fresh.attempts, 2)
+        execute(fresh.pk, fresh.claim)
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING)
+        execute(stale.pk, stale.claim)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(CALLS, ['once', 'once'])
+
+    @override_settings(POSTS_FANOUT_INLINE_LIMIT=0)
+    def test_large_fan_out_goes_to_queue(self):
+        """Раскладка поста автора с многими подписчиками — в очереди."""
+        author = User.objects.create_user(username='QueueAuthor')
+        reader = User.objects.create_user(username='QueueReader')
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(text='Queued post', author=author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        run_pending()
+        self.assertTrue(
+            TimelineEntry.objects.filter(post=post, user=reader).exists()
+        )
+
+    @override_settings(POSTS_FANOUT_INLINE_LIMIT=0)
+    def test_queued_fan_out_refreshes_cached_feed(self):
+        """После раскладки в очереди закэшированная лента подписчика
+        показывает новый пост."""
+        cache.clear()
+        author = User.objects.create_user(username='QueueAuthor')
+        reader = User.objects.create_user(username='QueueReader')
+        Follow.objects.create(user=reader, author=author)
+        self.client.force_login(reader)
+        self.client.get(reverse('posts:follow_index'))
+        Post.objects.create(text='Queued and cached', author=author)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, 'Queued and cached')
+        run_pending()
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Queued and cached')
+
+    def test_password_reset_email_sent_by_worker(self):
+        """Письмо сброса пароля отправляет воркер, а не запрос."""
+        User.objects.create_user(
+            username='Forgetful', email='f@example.com', password='secret'
+        )
+        response = self.client.post(
+            reverse('users:password_reset'), {'email': 'f@example.com'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        payload = json.loads(Job.objects.get().payload)
+        self.assertNotIn('body', payload)
+        self.assertNotIn('token', payload)
+        self.assertNotIn('f@example.com', payload.values())
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['f@example.com'])
+        link = re.search(r'/auth/reset/\S+/\S+/', mail.outbox[0].body)
+        self.assertIsNotNone(link)
+        self.assertNotIn(link.group(0), Job.objects.get().payload)
+
+    @override_settings(JOBS_KEEP_DONE=60, JOBS_KEEP_FAILED=600)
+    def test_prune_finished_jobs(self):
+        """Давно завершённые задачи удаляются, остальные остаются."""
+        old = timezone.now() - timedelta(seconds=300)
+        done = enqueue(record, value='done')
+        failed = enqueue(record, value='failed')
+        queued = enqueue(record, value='queued')
+        Job.objects.filter(pk=done.pk).update(status=Job.DONE, finished=old)
+        Job.objects.filter(pk=failed.pk).update(
+            status=Job.FAILED, finished=old
+        )
+        self.assertEqual(prune(), 1)
+        self.assertEqual(
+            set(Job.objects.values_list('pk', flat=True)),
+            {failed.pk, queued.pk},
+        )
+
+
+class RunWorkerTests(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_runworker_once(self):
+        """runworker --once выполняет готовые задачи в пуле и выходит."""
+        for i in range(5):
+            enqueue(record, value=i)
+        enqueue(explode, max_attempts=1)
+        out = StringIO()
+        # Тестовая БД SQLite в памяти не ждёт снятия блокировки записи,
+        # поэтому параллельные воркеры в ней мешали бы друг другу.
+        with self.assertLogs('yatube.jobs', 'WARNING'):
+            call_command('runworker', once=True, concurrency=1, stdout=out)
+        self.assertEqual(sorted(CALLS), list(range(5)))
+        self.assertIn('Выполнено задач: 5, с ошибкой: 1', out.getvalue())
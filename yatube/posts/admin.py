@@ -1,8 +1,24 @@
 from django.contrib import admin
+from django.db import connection
 from .models import Post, Group, Comment, Follow
+from .search import COMMENT, POST, fts_query, matching_ids
 
 
-class PostAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    """Поиск в админке по индексу FTS5 вместо LIKE '%q%' по таблице."""
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if connection.vendor != 'sqlite' or not fts_query(search_term):
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(
+            pk__in=matching_ids(search_term, self.search_kind)
+        ), False
+
+
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,18 +28,20 @@ class PostAdmin(admin.ModelAdmin):
     )
     list_editable = ('group',)
     search_fields = ('text',)
+    search_kind = POST
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = (
         'post',
         'author',
         'text',
         'created',
     )
-    search_fields = ('text', 'post')
+    search_fields = ('text',)
+    search_kind = COMMENT
     list_filter = ('created',)
     empty_value_display = '-пусто-'
 
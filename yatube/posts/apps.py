@@ -1,5 +1,28 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def clear_caches(**kwargs):
+    # Кэш переживает перезапуск процессов, а после миграций в нём
+    # могут остаться страницы и объекты под старую схему и данные.
+    from django.conf import settings
+    from django.core.cache import caches
+
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def install_search_triggers(using, **kwargs):
+    from .search import install_triggers
+
+    install_triggers(using)
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(clear_caches, sender=self)
+        post_migrate.connect(install_search_triggers, sender=self)
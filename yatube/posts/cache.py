@@ -0,0 +1,252 @@
+import hashlib
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.utils.encoding import iri_to_uri
+from django.views.decorators.http import condition
+
+from core.compression import accepts_gzip, compress, decompress
+from .models import Group
+
+
+def tag_key(tag):
+    # В теге может оказаться slug группы с пробелами и не-ASCII, а ключи
+    # memcached — только печатный ASCII без пробелов.
+    return f'posts:tag:{iri_to_uri(tag)}'
+
+
+def new_version():
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+def version_time(version):
+    """Время записи, после которой тег получил эту версию."""
+    return float(version.split(':', 1)[0])
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; отсутствующие теги получают новую версию.
+
+    Версия — время изменения и случайный токен, а не счётчик: после
+    сброса кэша старые страницы не смогут совпасть с новыми ключами.
+    """
+    keys = [tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def request_tags(request, get_tags, *args, **kwargs):
+    """Теги страницы, один раз за запрос для одной функции get_tags."""
+    memo = request.__dict__.setdefault('posts_tags', {})
+    if get_tags not in memo:
+        memo[get_tags] = list(get_tags(request, *args, **kwargs))
+    return memo[get_tags]
+
+
+def request_tag_versions(request, tags):
+    """tag_versions, один раз за запрос для одного набора тегов."""
+    memo = request.__dict__.setdefault('posts_tag_versions', {})
+    if tuple(tags) not in memo:
+        memo[tuple(tags)] = tag_versions(tags)
+    return memo[tuple(tags)]
+
+
+def bump_tags(*tags):
+    """Инвалидирует все страницы, закэшированные с любым из тегов."""
+    cache.set_many({tag_key(tag): new_version() for tag in tags}, None)
+
+
+def post_tags(post, group_id=None):
+    """Теги страниц, на которых виден пост (или была его старая группа)."""
+    tags = ['global', f'author:{post.author_id}', f'post:{post.pk}']
+    group_id = group_id or post.group_id
+    if group_id:
+        slug = Group.objects.filter(pk=group_id).values_list(
+            'slug', flat=True
+        ).first()
+        tags.append(f'group:{slug}')
+    return tags
+
+
+METRICS = ('hit', 'miss', 'early', 'stale', 'rebuild')
+
+
+def count(event):
+    key = f'posts:cache:metrics:{event}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчик вытеснили между add и incr: метрика приблизительная.
+        pass
+
+
+def cache_metrics():
+    """Сколько раз кэш отдал свежее, старое значение или пересобрал его."""
+    keys = {f'posts:cache:metrics:{event}': event for event in METRICS}
+    values = cache.get_many(keys)
+    return {event: values.get(key, 0) for key, event in keys.items()}
+
+
+def get_or_build(key, version, build, timeout, cacheable=None):
+    """Значение из кэша с ранним пересчётом и одиночной пересборкой.
+
+    Запись хранит версию, срок годности и время последней сборки.
+    Срок проверяется по схеме XFetch: чем ближе истечение и чем дольше
+    сборка, тем выше шанс пересобрать значение заранее. Устаревшую или
+    не совпавшую по версии запись пересобирает только процесс, взявший
+    блокировку через cache.add; остальные тем временем отдают старую
+    копию. Без старой копии значение собирается сразу.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        entry_version, value, expires_at, delta = entry
+        fresh = entry_version == version and now < expires_at
+        early = fresh and now - delta * settings.POSTS_CACHE_XFETCH_BETA * (
+            math.log(random.random() or 1e-12)
+        ) >= expires_at
+        if fresh and not early:
+            count('hit')
+            return value
+        if not cache.add(f'{key}:lock', 1, settings.POSTS_CACHE_LOCK_TIMEOUT):
+            count('stale')
+            return value
+        count('early' if early else 'rebuild')
+    else:
+        count('miss')
+    try:
+        start = time.time()
+        value = build()
+        delta = time.time() - start
+        if cacheable is None or cacheable(value):
+            cache.set(
+                key,
+                (version, value, start + timeout, delta),
+                timeout + settings.POSTS_CACHE_STALE_TIMEOUT,
+            )
+    finally:
+        if entry is not None:
+            cache.delete(f'{key}:lock')
+    return value
+
+
+def page_state(request, tags):
+    """Ключ страницы и версия — отпечаток версий её тегов.
+
+    Ключ строится из адреса и имён тегов: у /follow/ разных
+    пользователей разные теги feed:<id>, а значит и разные записи.
+    Иначе устаревшую запись одного пользователя, которую отдаёт
+    get_or_build, пока другой процесс её пересобирает, получил бы другой.
+    """
+    path = request.get_full_path()
+    versions = request_tag_versions(request, tags)
+    return (
+        hashlib.md5('|'.join([path, *tags]).encode()).hexdigest(),
+        hashlib.md5('|'.join(versions).encode()).hexdigest(),
+    )
+
+
+def cache_page_by_tags(get_tags):
+    """Кэширует страницу до записи в любой из её тегов.
+
+    get_tags(request, **kwargs) возвращает теги страницы, например
+    ['global'] или ['group:<slug>']; сигналы моделей сбрасывают их
+    через bump_tags.
+
+    Анонимам страница отдаётся из кэша целиком, сжатой gzip. Для
+    авторизованных пользователей view выполняется, а шаблон кэширует
+    только список постов тегом {% cached_posts %}: шапка с именем
+    пользователя всегда рисуется заново и не попадает к другим
+    посетителям.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            request.posts_cache_key, request.posts_cache_version = (
+                page_state(
+                    request, request_tags(request, get_tags, *args, **kwargs)
+                )
+            )
+            if request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            # В кэше страница лежит сжатой: попадания отдаются без
+            # повторного сжатия, а редким клиентам без gzip — разжатыми.
+            response = get_or_build(
+                f'posts:page:{request.posts_cache_key}',
+                request.posts_cache_version,
+                lambda: compress(view(request, *args, **kwargs)),
+                settings.POSTS_PAGE_CACHE_TIMEOUT,
+                cacheable=lambda response: response.status_code == 200,
+            )
+            if not accepts_gzip(request):
+                decompress(response)
+            return response
+        return wrapper
+    return decorator
+
+
+def condition_by_tags(get_tags):
+    """Отвечает 304 Not Modified, пока не менялся ни один тег страницы.
+
+    ETag — отпечаток версий тегов и пользователя (шапка у каждого
+    своя), а у авторизованных ещё сессии и CSRF-cookie: после повторного
+    входа страница с формами должна прийти с новым CSRF-токеном, а не
+    304 на копию со старым. Last-Modified — время последнего изменения
+    тега. Страница
+    при проверке не рендерится. Cache-Control: no-cache разрешает
+    прокси хранить страницу, но требует перепроверять её по этим
+    заголовкам; страницы авторизованных помечаются private.
+    """
+    def versions(request, *args, **kwargs):
+        tags = request_tags(request, get_tags, *args, **kwargs)
+        return request_tag_versions(request, tags)
+
+    def etag(request, *args, **kwargs):
+        parts = [str(request.user.pk or 0)]
+        if request.user.is_authenticated:
+            # get_token заводит секрет, если cookie ещё нет, и ответ его
+            # установит: ETag сразу считается по тому секрету, с которым
+            # отрисована страница.
+            get_token(request)
+            parts += [
+                request.session.session_key or '',
+                request.META['CSRF_COOKIE'],
+            ]
+        raw = '|'.join([*parts, *versions(request, *args, **kwargs)])
+        # Слабый: один и тот же ETag получают сжатая копия из кэша и её
+        # разжатый вариант, побайтно они разные.
+        return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+    def last_modified(request, *args, **kwargs):
+        return datetime.fromtimestamp(
+            max(map(version_time, versions(request, *args, **kwargs))),
+            tz=timezone.utc,
+        )
+
+    def decorator(view):
+        @condition(etag_func=etag, last_modified_func=last_modified)
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                patch_cache_control(response, no_cache=True, private=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,157 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, MediaFile, Post, UserStats
+
+User = get_user_model()
+
+
+def change(queryset, **deltas):
+    """Атомарно сдвигает счётчики строк queryset одним UPDATE ... SET f=f+d.
+
+    Счётчик не уходит ниже нуля: такие строки пропускаются до
+    пересчёта командой repair_counters. Возвращает число обновлённых строк.
+    """
+    for field, delta in deltas.items():
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def change_user_stats(user_id, **deltas):
+    if user_id is None:
+        return
+    updated = change(UserStats.objects.filter(user_id=user_id), **deltas)
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        # Строки ещё нет (пользователь создан в обход сигналов):
+        # считаем её целиком, а не начинаем с нуля.
+        repair_user_stats(User.objects.filter(pk=user_id))
+
+
+def change_media_refs(name, delta):
+    """Сдвигает счётчик ссылок на файл картинки и отмечает время.
+
+    По этому времени gc_media выдерживает паузу, прежде чем удалить
+    файл, на который больше никто не ссылается.
+    """
+    if not name:
+        return
+    files = MediaFile.objects.filter(name=name)
+    if delta < 0:
+        files = files.filter(refs__gte=-delta)
+    updated = files.update(refs=F('refs') + delta, changed=timezone.now())
+    if not updated and delta > 0:
+        MediaFile.objects.update_or_create(
+            name=name,
+            defaults={
+                'refs': Post.objects.filter(image=name).count(),
+                'changed': timezone.now(),
+            },
+        )
+
+
+def count_of(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0
+    )
+
+
+def repair(queryset, counters, dry_run=False):
+    """Пересчитывает счётчики и исправляет строки, где они разошлись.
+
+    counters — словарь {поле: выражение с фактическим значением}.
+    Возвращает число исправленных (при dry_run — найденных) строк.
+    """
+    drifted = queryset.annotate(
+        **{f'actual_{field}': expr for field, expr in counters.items()}
+    ).filter(
+        ~Q(**{field: F(f'actual_{field}') for field in counters})
+    )
+    rows = []
+    for obj in drifted.iterator():
+        for field in counters:
+            setattr(obj, field, getattr(obj, f'actual_{field}'))
+        rows.append(obj)
+    if not dry_run:
+        queryset.model.objects.bulk_update(
+            rows, list(counters), batch_size=500
+        )
+    return len(rows)
+
+
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def repair_user_stats(users, dry_run=False):
+    """Создаёт недостающие UserStats и исправляет расхождения в остальных."""
+    counters = {
+        field: count_of(model, lookup)
+        for field, (model, lookup) in USER_COUNTERS.items()
+    }
+    missing = [
+        UserStats(
+            user=user, **{field: getattr(user, field) for field in counters}
+        )
+        for user in users.filter(stats__isnull=True)
+        .annotate(**counters).iterator()
+    ]
+    if not dry_run:
+        UserStats.objects.bulk_create(
+            missing, batch_size=500, ignore_conflicts=True
+        )
+    return len(missing) + repair(
+        UserStats.objects.filter(user__in=users), counters, dry_run
+    )
+
+
+def repair_media_files(dry_run=False):
+    """Заводит учёт ссылок для картинок без него и исправляет остальные."""
+    missing = [
+        MediaFile(name=row['image'], refs=row['refs'])
+        for row in Post.objects.exclude(image='').annotate(
+            known=Exists(MediaFile.objects.filter(name=OuterRef('image')))
+        ).filter(known=False).order_by().values('image').annotate(
+            refs=Count('pk')
+        ).iterator()
+    ]
+    if not dry_run:
+        MediaFile.objects.bulk_create(
+            missing, batch_size=500, ignore_conflicts=True
+        )
+    return len(missing) + repair(
+        MediaFile.objects.all(), {'refs': count_of(Post, 'image')}, dry_run
+    )
+
+
+def repair_all(dry_run=False):
+    """Сверяет все счётчики с фактическими данными, возвращает расхождения."""
+    return {
+        'posts': repair(
+            Post.objects.all(),
+            {'comments_count': count_of(Comment, 'post')},
+            dry_run
+        ),
+        'groups': repair(
+            Group.objects.all(),
+            {'posts_count': count_of(Post, 'group')},
+            dry_run
+        ),
+        'users': repair_user_stats(User.objects.all(), dry_run),
+        'media': repair_media_files(dry_run),
+    }
@@ -0,0 +1,161 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import F
+
+from core.files import batched
+
+from .models import Follow, Post, TimelineEntry
+
+# Частей в одном UNION ALL: в SQLite их не больше 500.
+UNION_CHUNK = 400
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора и
+    возвращает их id."""
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id, user__isnull=False
+    ).values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        ],
+        ignore_conflicts=True,
+    )
+    return followers
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date'
+    )[:settings.POSTS_TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def timeline_posts(user):
+    """Посты ленты пользователя: чтение диапазона индекса (user, pub_date).
+
+    feed_date и feed_id берутся из записи ленты, чтобы сортировка и
+    keyset-курсор шли по индексу posts_timeline_user_date.
+    """
+    return Post.objects.filter(timeline_entries__user=user).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_id=F('timeline_entries__post_id'),
+    ).order_by('-feed_date', '-feed_id')
+
+
+def author_stream_key(author_id):
+    return f'posts:author_stream:{author_id}'
+
+
+def author_streams(author_ids):
+    """Ограниченные newest-first списки (pub_date, id) постов авторов.
+
+    Берутся из кэша одним get_many, промахи дочитываются из БД одним
+    запросом на UNION_CHUNK авторов (load_streams).
+    """
+    keys = {
+        author_stream_key(author_id): author_id for author_id in author_ids
+    }
+    streams = cache.get_many(keys)
+    missing = [
+        author_id for key, author_id in keys.items() if key not in streams
+    ]
+    if missing:
+        loaded = {
+            author_stream_key(author_id): stream
+            for author_id, stream in load_streams(missing).items()
+        }
+        cache.set_many(loaded, settings.POSTS_AUTHOR_STREAM_TIMEOUT)
+        streams.update(loaded)
+    return list(streams.values())
+
+
+def load_streams(author_ids):
+    """Потоки авторов из БД: UNION ALL выборок по индексу
+    posts_post_author_date, каждая со своим LIMIT.
+
+    QuerySet.union() в SQLite не разрешает LIMIT в частях составного
+    запроса, поэтому части оборачиваются в подзапросы вручную.
+    """
+    streams = {author_id: [] for author_id in author_ids}
+    for chunk in batched(author_ids, UNION_CHUNK):
+        parts, params = [], []
+        for author_id in chunk:
+            sql, part_params = Post.objects.filter(
+                author_id=author_id
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'author_id', 'pub_date'
+            )[:settings.POSTS_AUTHOR_STREAM_SIZE].query.sql_with_params()
+            parts.append(f'SELECT * FROM ({sql})')
+            params.extend(part_params)
+        for post in Post.objects.raw(' UNION ALL '.join(parts), params):
+            streams[post.author_id].append((post.pub_date, post.id))
+    # Порядок строк UNION ALL не гарантирован.
+    for stream in streams.values():
+        stream.sort(reverse=True)
+    return streams
+
+
+def forget_author_stream(author_id):
+    cache.delete(author_stream_key(author_id))
+
+
+class MergedStream:
+    """Ленивое k-way слияние потоков авторов для Paginator.
+
+    Длина — сумма длин потоков, срез сливает потоки заново и
+    останавливается на нужной позиции, возвращая id постов.
+    """
+
+    def __init__(self, streams):
+        self.streams = streams
+
+    def __len__(self):
+        return sum(len(stream) for stream in self.streams)
+
+    def __getitem__(self, index):
+        merged = heapq.merge(*self.streams, reverse=True)
+        return [
+            post_id for _, post_id in
+            islice(merged, index.start, index.stop)
+        ]
+
+
+def merged_page(user, page_number):
+    """Страница ленты подписок, собранная из кэшированных потоков авторов.
+
+    Из БД загружаются только посты, попавшие на страницу.
+    """
+    author_ids = Follow.objects.filter(user=user).values_list(
+        'author_id', flat=True
+    )
+    paginator = Paginator(
+        MergedStream(author_streams(author_ids)), settings.POSTS_PER_PAGE
+    )
+    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.previews().in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        posts[post_id] for post_id in page_obj.object_list
+        if post_id in posts
+    ]
+    return page_obj
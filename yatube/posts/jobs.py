@@ -0,0 +1,62 @@
+import json
+
+from core.files import batched
+from jobs.queue import task
+
+from . import feeds
+from .cache import bump_tags, post_tags
+from .counters import repair_all
+from .models import Post
+from .thumbnails import make_thumbnails
+
+# Сколько тегов лент сбрасывать одним set_many.
+TAGS_BATCH = 500
+
+
+@task
+def fan_out(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        return
+    # Тег global сброшен ещё при публикации: ленты, собранные до конца
+    # раскладки, закэшированы без нового поста.
+    for followers in batched(feeds.fan_out(post), TAGS_BATCH):
+        bump_tags(*(f'feed:{user_id}' for user_id in followers))
+
+
+@task
+def repair_counters():
+    repair_all()
+
+
+def twin_variants(image_hash, name):
+    """Готовые варианты той же картинки у другого поста или ''.
+
+    Совпасть должно и имя файла: у одинакового содержимого с другим
+    расширением свой файл, а варианты ссылаются на миниатюры своего
+    источника, которые удалят вместе с ним.
+    """
+    if not image_hash or not name:
+        return ''
+    return Post.objects.filter(
+        image_hash=image_hash, image=name, thumbnails_ready=True
+    ).exclude(image_variants='').values_list(
+        'image_variants', flat=True
+    ).first() or ''
+
+
+@task
+def thumbnails(post_id, image):
+    post = Post.objects.filter(pk=post_id, image=image).first()
+    if post is None:
+        # Пост удалён или картинку уже заменили: ею займётся новая задача.
+        return
+    # Одинаковые картинки, загруженные почти одновременно, режутся один раз.
+    variants = twin_variants(
+        post.image_hash, post.image.name
+    ) or json.dumps(make_thumbnails(post.image))
+    Post.objects.filter(pk=post_id, image=image).update(
+        thumbnails_ready=True, image_variants=variants
+    )
+    # Страницы закэшированы с заглушкой вместо картинки.
+    bump_tags(*post_tags(post))
@@ -0,0 +1,24 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from posts.cache import cache_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает, сколько раз кэш страниц отдал свежую или старую '
+        'копию, пересобрал её заранее или после сброса, и попадания '
+        'в уровни кэша.'
+    )
+
+    def handle(self, *args, **options):
+        metrics = cache_metrics()
+        served = metrics['hit'] + metrics['stale']
+        for event, value in metrics.items():
+            self.stdout.write(f'{event}: {value}')
+        if served:
+            share = metrics['stale'] / served * 100
+            self.stdout.write(f'stale share: {share:.1f}%')
+        if hasattr(cache, 'tier_stats'):
+            for tier, value in cache.tier_stats().items():
+                self.stdout.write(f'{tier}: {value}')
@@ -0,0 +1,221 @@
+import os
+import shutil
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from core.files import batched, walk
+from posts.counters import count_of
+from posts.models import MediaFile, Post, image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет или переносит в карантин картинки, на которые не ссылается '
+        'ни один пост, и их миниатюры. Каталоги и хранилище sorl.thumbnail '
+        'читаются порциями, а удаление ограничено по скорости, поэтому '
+        'команду можно запускать на работающем сервере.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--quarantine',
+            metavar='DIR',
+            help='Переносить картинки в этот каталог вне MEDIA_ROOT, а не '
+                 'удалять. Миниатюры удаляются всегда: их можно создать '
+                 'заново.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы моложе стольких секунд: их загрузка '
+                 'может быть ещё не записана в БД.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов сверять с БД одним запросом.',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=settings.MEDIA_GC_RATE,
+            help='Не больше стольких удалений в секунду '
+                 '(0 — без ограничения).',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.cutoff = time.time() - options['min_age']
+        self.next_slot = time.monotonic()
+        self.upload_dir = Post._meta.get_field('image').upload_to.rstrip('/')
+        self.stats = Counter()
+        self.collect_sources()
+        self.collect_images()
+        self.collect_thumbnails()
+        if options['dry_run']:
+            verb = 'Найдено'
+        elif options['quarantine']:
+            verb = 'Перенесено в карантин'
+        else:
+            verb = 'Удалено'
+        self.stdout.write(
+            f'{verb} картинок: {self.stats["images"]} '
+            f'({self.stats["bytes"]} байт), '
+            f'миниатюр: {self.stats["thumbnails"]}'
+        )
+
+    def collect_sources(self):
+        """Миниатюры картинок, которых нет ни у одного поста, по записям
+        хранилища sorl.thumbnail."""
+        prefix = add_prefix('', identity='thumbnails')
+        last = prefix
+        while True:
+            # Постранично по ключу: удаление найденного не сбивает обход.
+            keys = list(
+                KVStore.objects.filter(key__startswith=prefix, key__gt=last)
+                .order_by('key').values_list('key', flat=True)
+                [:self.options['batch_size']]
+            )
+            if not keys:
+                return
+            last = keys[-1]
+            sources = [
+                deserialize_image_file(value)
+                for value in KVStore.objects.filter(
+                    key__in=[add_prefix(del_prefix(key)) for key in keys]
+                ).values_list('value', flat=True)
+            ]
+            sources = [
+                source for source in sources
+                if source.name.startswith(self.upload_dir + '/')
+            ]
+            referenced = self.referenced(source.name for source in sources)
+            for source in sources:
+                if source.name in referenced or self.is_recent(source.name):
+                    continue
+                thumbnails = default.kvstore._get(
+                    source.key, identity='thumbnails'
+                ) or []
+                self.stats['thumbnails'] += len(thumbnails)
+                self.report(f'миниатюры {source.name}')
+                if not self.options['dry_run']:
+                    self.throttle(len(thumbnails))
+                    default.kvstore.delete(source)
+
+    def collect_images(self):
+        """Файлы в каталоге загрузок, которых нет ни у одного поста."""
+        for batch in batched(
+            self.old_files(self.upload_dir), self.options['batch_size']
+        ):
+            files = dict(batch)
+            referenced = self.referenced(files)
+            for name in files:
+                if name in referenced:
+                    continue
+                size = files[name].stat().st_size
+                if not self.options['dry_run']:
+                    self.throttle()
+                    # Пока шёл обход и пауза, картинку могли загрузить
+                    # снова: решение принимается заново перед удалением.
+                    if not self.still_orphan(name):
+                        continue
+                    self.remove_image(name, files[name].path)
+                self.stats['images'] += 1
+                self.stats['bytes'] += size
+                self.report(name)
+
+    def still_orphan(self, name):
+        """Свежая проверка картинки прямо перед удалением, как в gc_media:
+        на неё не ссылается ни один пост, учёт ссылок пуст и удалён, и
+        файл не трогали с начала обхода."""
+        if self.is_recent(name):
+            return False
+        # Счётчик мог разойтись с постами (правка в обход сигналов):
+        # пересчёт одним UPDATE не теряет параллельных прибавлений.
+        MediaFile.objects.filter(name=name).update(
+            refs=count_of(Post, 'image')
+        )
+        MediaFile.objects.filter(name=name, refs=0).delete()
+        if (
+            MediaFile.objects.filter(name=name).exists()
+            or Post.objects.filter(image=name).exists()
+        ):
+            return False
+        return not self.is_recent(name)
+
+    def collect_thumbnails(self):
+        """Файлы миниатюр, о которых не знает хранилище sorl.thumbnail."""
+        top = thumbnail_settings.THUMBNAIL_PREFIX.rstrip('/')
+        for batch in batched(self.old_files(top), self.options['batch_size']):
+            keys = {
+                add_prefix(ImageFile(name, default.storage).key): name
+                for name, entry in batch
+            }
+            known = set(
+                KVStore.objects.filter(key__in=keys)
+                .values_list('key', flat=True)
+            )
+            for key, name in keys.items():
+                if key in known:
+                    continue
+                self.stats['thumbnails'] += 1
+                self.report(name)
+                if not self.options['dry_run']:
+                    self.throttle()
+                    default.storage.delete(name)
+
+    def old_files(self, top):
+        for name, entry in walk(settings.MEDIA_ROOT, top):
+            if entry.stat().st_mtime <= self.cutoff:
+                yield name, entry
+
+    def referenced(self, names):
+        return set(
+            Post.objects.filter(image__in=list(names))
+            .values_list('image', flat=True)
+        )
+
+    def is_recent(self, name):
+        try:
+            return os.path.getmtime(image_storage.path(name)) > self.cutoff
+        except OSError:
+            return False
+
+    def remove_image(self, name, path):
+        quarantine = self.options['quarantine']
+        if not quarantine:
+            image_storage.delete(name)
+            return
+        target = os.path.join(quarantine, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+
+    def report(self, name):
+        if self.options['dry_run'] or self.options['verbosity'] > 1:
+            self.stdout.write(name)
+
+    def throttle(self, count=1):
+        """Растягивает удаления так, чтобы их было не больше --rate в
+        секунду."""
+        rate = self.options['rate']
+        if not rate:
+            return
+        now = time.monotonic()
+        if self.next_slot > now:
+            time.sleep(self.next_slot - now)
+        self.next_slot = max(self.next_slot, now) + count / rate
@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Follow, Post, UserStats
+
+
+def hot_queries():
+    """Запросы горячих страниц: имя и QuerySet.
+
+    Для фильтров берутся самые «тяжёлые» автор, группа и пост, чтобы
+    план и время соответствовали худшему случаю.
+    """
+    author_id = UserStats.objects.order_by('-posts_count').values_list(
+        'user_id', flat=True
+    ).first()
+    group_id = Post.objects.filter(group__isnull=False).order_by(
+        '-group__posts_count'
+    ).values_list('group_id', flat=True).first()
+    post_id = Post.objects.order_by('-comments_count').values_list(
+        'id', flat=True
+    ).first()
+    follow = Follow.objects.values_list('user_id', 'author_id').first()
+    user_id, followed_id = follow or (None, None)
+    per_page = settings.POSTS_PER_PAGE
+    return [
+        ('profile', Post.objects.previews().filter(
+            author_id=author_id
+        )[:per_page]),
+        ('group_posts', Post.objects.previews().filter(
+            group_id=group_id
+        )[:per_page]),
+        ('post_detail comments', Comment.objects.select_related(
+            'author'
+        ).filter(post_id=post_id)),
+        ('profile following', Follow.objects.filter(
+            user_id=user_id, author_id=followed_id
+        )),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает план выполнения и среднее время запросов горячих '
+        'страниц постов. Запустите до и после миграции индексов, чтобы '
+        'сравнить планы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз выполнить каждый запрос для замера.',
+        )
+
+    def handle(self, *args, **options):
+        for name, queryset in hot_queries():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - start) / options['repeat']
+            self.stdout.write(f'среднее время: {elapsed * 1000:.2f} мс')
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import MediaFile, image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы картинок, на которые не ссылается ни один пост, '
+        'вместе с их миниатюрами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы, ссылки на которые пропали или которые '
+                 'загружали заново за последние столько секунд.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, ничего не удаляя.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        orphans = MediaFile.objects.filter(
+            refs=0, changed__lt=cutoff
+        ).values_list('name', flat=True)
+        removed = 0
+        for name in orphans.iterator():
+            if self.touched_since(name, cutoff):
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+                removed += 1
+                continue
+            # Ссылка могла появиться после выборки: удаляем строку учёта,
+            # только если ссылок по-прежнему нет, и лишь затем файл.
+            deleted, _ = MediaFile.objects.filter(name=name, refs=0).delete()
+            if deleted:
+                delete(ImageFile(name, image_storage))
+                removed += 1
+        verb = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(f'{verb} файлов: {removed}')
+
+    def touched_since(self, name, cutoff):
+        try:
+            return image_storage.get_modified_time(name) >= cutoff
+        except OSError:
+            return False
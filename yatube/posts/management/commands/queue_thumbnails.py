@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from jobs.queue import enqueue
+from posts.jobs import thumbnails
+from posts.models import Post
+from posts.thumbnails import QUEUE
+
+
+class Command(BaseCommand):
+    help = (
+        'Ставит в очередь создание вариантов картинки для постов, у '
+        'которых их ещё нет (например, загруженных до их появления).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать варианты всех картинок.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(image_variants='')
+        total = 0
+        for post_id, image in posts.values_list('pk', 'image').iterator():
+            enqueue(thumbnails, queue=QUEUE, post_id=post_id, image=image)
+            total += 1
+        self.stdout.write(f'Поставлено задач: {total}')
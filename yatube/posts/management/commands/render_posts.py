@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет заранее отрисованный HTML текста и превью постов '
+        '(например, созданных через bulk_create или до миграции).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перерисовать все посты, а не только пустые.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only('text').order_by('pk')
+        if not options['all']:
+            posts = posts.filter(text_html='')
+        batch, total = [], 0
+        for post in posts.iterator(chunk_size=options['batch_size']):
+            post.render()
+            batch.append(post)
+            if len(batch) == options['batch_size']:
+                total += self.flush(batch)
+                batch = []
+        total += self.flush(batch)
+        self.stdout.write(f'Перерисовано постов: {total}')
+
+    def flush(self, batch):
+        Post.objects.bulk_update(
+            batch, ['text_html', 'excerpt_html', 'excerpt_truncated']
+        )
+        return len(batch)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from jobs.queue import enqueue
+from posts.counters import repair_all
+from posts.jobs import repair_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов, комментариев и подписок '
+        'и исправляет расхождения с фактическими данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя.',
+        )
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Поставить пересчёт в фоновую очередь и выйти.',
+        )
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = enqueue(repair_counters)
+            self.stdout.write(f'Поставлена задача {job}')
+            return
+        drift = repair_all(dry_run=options['dry_run'])
+        verb = 'найдено' if options['dry_run'] else 'исправлено'
+        for name, count in drift.items():
+            self.stdout.write(f'{name}: {verb} {count}')
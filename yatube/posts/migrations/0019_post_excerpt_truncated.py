@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:10
+
+from django.db import migrations, models
+
+from posts.rendering import excerpt
+
+
+def mark_truncated(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    batch = []
+    for post in Post.objects.only('text').iterator():
+        if excerpt(post.text) != post.text:
+            post.excerpt_truncated = True
+            batch.append(post)
+        if len(batch) == 500:
+            Post.objects.bulk_update(batch, ['excerpt_truncated'])
+            batch = []
+    Post.objects.bulk_update(batch, ['excerpt_truncated'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Превью обрезано'),
+        ),
+        migrations.RunPython(mark_truncated, migrations.RunPython.noop),
+    ]
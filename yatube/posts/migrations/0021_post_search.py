@@ -0,0 +1,95 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:20
+
+from django.db import migrations
+
+# rowid строки индекса: 2 * id для поста, 2 * id + 1 для комментария.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE posts_search USING fts5(
+        text, post_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER posts_post_search_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2, new.text, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_search_update AFTER UPDATE OF text
+    ON posts_post
+    BEGIN
+        UPDATE posts_search SET text = new.text WHERE rowid = new.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_search_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_comment_search_insert AFTER INSERT
+    ON posts_comment
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2 + 1, new.text, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_comment_search_update AFTER UPDATE OF text, post_id
+    ON posts_comment
+    BEGIN
+        UPDATE posts_search SET text = new.text, post_id = new.post_id
+        WHERE rowid = new.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_comment_search_delete AFTER DELETE
+    ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+    """
+    INSERT INTO posts_search (rowid, text, post_id)
+    SELECT id * 2, text, id FROM posts_post
+    """,
+    """
+    INSERT INTO posts_search (rowid, text, post_id)
+    SELECT id * 2 + 1, text, post_id FROM posts_comment
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER posts_post_search_insert',
+    'DROP TRIGGER posts_post_search_update',
+    'DROP TRIGGER posts_post_search_delete',
+    'DROP TRIGGER posts_comment_search_insert',
+    'DROP TRIGGER posts_comment_search_update',
+    'DROP TRIGGER posts_comment_search_delete',
+    'DROP TABLE posts_search',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # FTS5 и триггеры есть только в SQLite.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
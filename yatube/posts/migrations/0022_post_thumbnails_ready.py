@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    # Старые картинки показываются как раньше: sorl создаст миниатюру
+    # при первом показе, если её ещё нет.
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.exclude(image='').update(thumbnails_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Миниатюры готовы'),
+        ),
+        migrations.RunPython(
+            mark_existing_ready, migrations.RunPython.noop
+        ),
+    ]
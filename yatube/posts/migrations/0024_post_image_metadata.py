@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:24
+
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from core.files import content_hash
+
+
+def fill_image_metadata(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    images = Post.objects.exclude(image='').values_list('pk', 'image')
+    for pk, name in images.iterator():
+        try:
+            with default_storage.open(name, 'rb') as file:
+                image_hash, size = content_hash(file)
+                width, height = get_image_dimensions(file)
+        except OSError:
+            # Файл потерян: метаданные останутся пустыми.
+            continue
+        Post.objects.filter(pk=pk).update(
+            image_hash=image_hash,
+            image_size=size,
+            image_width=width,
+            image_height=height,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='SHA-256 картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Размер картинки в байтах'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(
+            fill_image_metadata, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:29
+
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+import django.utils.timezone
+
+
+def count_refs(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    images = Post.objects.exclude(image='').order_by().values(
+        'image'
+    ).annotate(refs=Count('pk'))
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=row['image'], refs=row['refs'])
+         for row in images.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('changed', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Изменён')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(condition=models.Q(refs=0), fields=['changed'], name='posts_mediafile_orphans'),
+        ),
+        migrations.RunPython(count_refs, migrations.RunPython.noop),
+    ]
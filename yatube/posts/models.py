@@ -1,9 +1,18 @@
+import json
+
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from core.storage import ContentAddressedStorage
+from .rendering import excerpt, render_excerpt, render_text
 
 
 User = get_user_model()
 
+# Картинки постов лежат под хэшем содержимого, одинаковые — одним файлом.
+image_storage = ContentAddressedStorage()
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Название группы')
@@ -12,11 +21,33 @@ class Group(models.Model):
         verbose_name='Относительный адрес группы'
     )
     description = models.TextField(verbose_name='Описание')
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self):
         return self.title
 
 
+# Поля, которые читают карточки постов в списках.
+PREVIEW_FIELDS = (
+    'pub_date', 'author', 'group', 'image', 'thumbnails_ready',
+    'image_variants', 'comments_count',
+    'excerpt_html', 'excerpt_truncated',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__title', 'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def previews(self):
+        """Только поля карточки поста в списках, без полного текста,
+        вместе с автором и группой одним запросом."""
+        return self.select_related('author', 'group').only(*PREVIEW_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -35,8 +66,44 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        'Размер картинки в байтах',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_hash = models.CharField(
+        'SHA-256 картинки',
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
+    thumbnails_ready = models.BooleanField(
+        'Миниатюры готовы',
+        default=False,
+        editable=False
+    )
+    image_variants = models.TextField(
+        'Варианты картинки (JSON)',
+        blank=True,
+        editable=False
+    )
     group = models.ForeignKey(
         Group,
         on_delete=models.SET_NULL,
@@ -46,13 +113,76 @@ class Post(models.Model):
         verbose_name='Группа',
         help_text='Выберите группу'
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+    text_html = models.TextField(
+        'HTML текста',
+        blank=True,
+        editable=False
+    )
+    excerpt_html = models.TextField(
+        'HTML превью',
+        blank=True,
+        editable=False
+    )
+    excerpt_truncated = models.BooleanField(
+        'Превью обрезано',
+        default=False,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        # Списки группы и профиля сортируются по дате прямо по индексу.
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='posts_post_author_date',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='posts_post_group_date',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def variants(self):
+        """Готовые варианты картинки: format, width, height, name."""
+        return json.loads(self.image_variants or '[]')
+
+    def render(self):
+        """Заранее готовит HTML текста, чтобы не прогонять фильтры
+        wordwrap и linebreaks при каждом показе поста."""
+        self.text_html = render_text(self.text)
+        self.excerpt_html = render_excerpt(self.text)
+        self.excerpt_truncated = excerpt(self.text) != self.text
+
+    def save(self, *args, **kwargs):
+        self.render()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'text' in update_fields:
+                update_fields |= {
+                    'text_html', 'excerpt_html', 'excerpt_truncated'
+                }
+            if 'image' in update_fields:
+                # Их заполняет сигнал pre_save при смене картинки.
+                update_fields |= {
+                    'image_width', 'image_height', 'image_size',
+                    'image_hash', 'thumbnails_ready', 'image_variants'
+                }
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -74,6 +204,15 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='posts_comment_post_created',
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -88,3 +227,71 @@ class Follow(models.Model):
         null=True,
         related_name='following',
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='posts_follow_unique',
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+
+class MediaFile(models.Model):
+    """Файл картинки в хранилище и число постов, которые на него ссылаются.
+
+    Одинаковые картинки хранятся одним файлом, поэтому удалить его можно,
+    только когда ссылок не осталось: это делает команда gc_media.
+    """
+    name = models.CharField('Имя файла', max_length=100, primary_key=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+    changed = models.DateTimeField('Изменён', default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['changed'],
+                name='posts_mediafile_orphans',
+                condition=models.Q(refs=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='posts_timeline_user_date',
+            ),
+        ]
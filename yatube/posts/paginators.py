@@ -0,0 +1,176 @@
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключа в непрозрачную строку."""
+    payload = json.dumps(
+        [direction] + [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ],
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, types):
+    """Обратная операция к encode_cursor; None для битого курсора.
+
+    types — ожидаемые типы значений ключа (datetime, int или float).
+    Курсор приходит из адресной строки, поэтому значения другого типа
+    или в другом количестве тоже считаются битым курсором.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, *values = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in (NEXT, PREVIOUS) or len(values) != len(types):
+            return None
+        return direction, [
+            parse_value(value, kind) for value, kind in zip(values, types)
+        ]
+    except (binascii.Error, TypeError, ValueError):
+        return None
+
+
+def parse_value(value, kind):
+    """Значение ключа из курсора или ValueError/TypeError."""
+    if kind is datetime:
+        parsed = parse_datetime(value)
+        if parsed is None or timezone.is_naive(parsed):
+            raise ValueError(value)
+        return parsed
+    # bool — подкласс int, но ключом быть не может.
+    if kind is int and type(value) is int:
+        return value
+    if kind is float and type(value) in (int, float) and math.isfinite(value):
+        return float(value)
+    raise TypeError(value)
+
+
+class CursorPage(Page):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return encode_cursor(
+            NEXT, self.paginator.key_values(self.object_list[-1])
+        )
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return encode_cursor(
+            PREVIOUS, self.paginator.key_values(self.object_list[0])
+        )
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по убыванию ключей (по умолчанию pub_date, id).
+
+    Не выполняет COUNT(*) и OFFSET: каждая страница — это выборка
+    per_page + 1 строк после (или до) ключа из курсора, поэтому время
+    её получения не зависит от глубины листания.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 types=(datetime, int)):
+        self.keys = keys
+        self.types = types
+        super().__init__(
+            object_list.order_by(*(f'-{key}' for key in keys)), per_page
+        )
+
+    def key_values(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def _seek(self, values, lookup):
+        condition = Q()
+        for position in reversed(range(len(self.keys))):
+            equal = {key: value for key, value in zip(
+                self.keys[:position], values[:position]
+            )}
+            condition |= Q(
+                **equal,
+                **{f'{self.keys[position]}__{lookup}': values[position]}
+            )
+        return condition
+
+    def get_page(self, cursor):
+        decoded = decode_cursor(cursor, self.types) if cursor else None
+        if decoded is None:
+            return self.first_page()
+        direction, values = decoded
+        if direction == PREVIOUS:
+            return self.previous_page(values)
+        return self.next_page(values)
+
+    def page(self, cursor):
+        return self.get_page(cursor)
+
+    def first_page(self):
+        rows = list(self.object_list[:self.per_page + 1])
+        return CursorPage(
+            rows[:self.per_page], self, len(rows) > self.per_page, False
+        )
+
+    def next_page(self, values):
+        rows = list(
+            self.object_list.filter(self._seek(values, 'lt'))
+            [:self.per_page + 1]
+        )
+        if not rows:
+            # Курсор за последним постом или соседние посты удалены.
+            return self.first_page()
+        return CursorPage(
+            rows[:self.per_page], self, len(rows) > self.per_page, True
+        )
+
+    def previous_page(self, values):
+        rows = list(
+            self.object_list.filter(self._seek(values, 'gt'))
+            .reverse()[:self.per_page + 1]
+        )
+        if not rows:
+            return self.first_page()
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(rows, self, True, has_previous)
+
+
+def paginate(request, post_list, keys=('pub_date', 'id')):
+    """Возвращает страницу post_list в режиме settings.POSTS_PAGINATION."""
+    if settings.POSTS_PAGINATION == 'cursor':
+        paginator = CursorPaginator(post_list, settings.POSTS_PER_PAGE, keys)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
+    return paginator.get_page(request.GET.get('page'))
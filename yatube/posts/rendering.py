@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.template.defaultfilters import linebreaks_filter, wordwrap
+from django.utils.text import Truncator
+
+
+def render_text(text):
+    """HTML полного текста, как {{ text|wordwrap:130|linebreaks }}."""
+    return linebreaks_filter(wordwrap(text, 130), autoescape=True)
+
+
+def excerpt(text):
+    """Текст, обрезанный до POSTS_EXCERPT_LENGTH символов."""
+    return Truncator(text).chars(settings.POSTS_EXCERPT_LENGTH)
+
+
+def render_excerpt(text):
+    """HTML превью для списков, как {{ text|wordwrap:160|linebreaks }}
+    по обрезанному тексту."""
+    return linebreaks_filter(wordwrap(excerpt(text), 160), autoescape=True)
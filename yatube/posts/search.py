@@ -0,0 +1,225 @@
+import re
+from dataclasses import dataclass
+
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import NEXT, PREVIOUS, decode_cursor, encode_cursor
+
+# Полнотекстовый индекс FTS5 posts_search (миграция 0021_post_search)
+# хранит текст постов и комментариев. rowid кодирует источник:
+# 2 * id для поста и 2 * id + 1 для комментария, поэтому триггеры
+# обновляют и удаляют строки индекса по rowid, без поиска.
+POST, COMMENT = 0, 1
+SNIPPET_TOKENS = 24
+# Метки совпадений в snippet(): управляющие символы не встречаются в
+# тексте и переживают экранирование HTML.
+MARK_START, MARK_END = '\x02', '\x03'
+
+WORD = re.compile(r'\w+')
+
+# Триггеры, которые держат индекс в согласии с таблицами. SQLite
+# удаляет триггеры вместе с таблицей, а миграции AddField/AlterField
+# пересоздают таблицу, поэтому после каждого migrate триггеры ставятся
+# заново (posts.apps), если их не стало.
+TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_search_insert
+    AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2, new.text, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_search_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        UPDATE posts_search SET text = new.text WHERE rowid = new.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_search_delete
+    AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_search_insert
+    AFTER INSERT ON posts_comment
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2 + 1, new.text, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_search_update
+    AFTER UPDATE OF text, post_id ON posts_comment
+    BEGIN
+        UPDATE posts_search SET text = new.text, post_id = new.post_id
+        WHERE rowid = new.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_search_delete
+    AFTER DELETE ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+]
+
+
+def install_triggers(using='default'):
+    """Ставит недостающие триггеры индекса posts_search."""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    if 'posts_search' not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in TRIGGERS:
+            cursor.execute(statement)
+
+
+def fts_query(text):
+    """Строка запроса пользователя в синтаксисе FTS5.
+
+    Каждое слово берётся в кавычки (операторы и спецсимволы FTS5 не
+    срабатывают) и ищется как префикс, чтобы «пост» находил «посты».
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(text.lower()))
+
+
+def highlight(snippet):
+    """Экранированный фрагмент с совпадениями в <mark>."""
+    html = escape(snippet)
+    html = html.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def matching_ids(text, kind):
+    """Подзапрос id постов или комментариев, подходящих под text."""
+    return RawSQL(
+        'SELECT rowid / 2 FROM posts_search '
+        'WHERE posts_search MATCH %s AND (rowid & 1) = %s',
+        [fts_query(text), kind],
+    )
+
+
+@dataclass
+class SearchHit:
+    post: Post
+    comment_id: int
+    snippet: str
+    score: float
+    rowid: int
+
+    @property
+    def is_comment(self):
+        return self.comment_id is not None
+
+
+class SearchPage:
+    """Страница результатов в порядке BM25 с keyset-курсорами.
+
+    Ключ — (score, rowid): курсор хранит ключ крайнего результата, и
+    следующая страница берётся строго после него, без OFFSET.
+    """
+
+    def __init__(self, hits, has_next, has_previous):
+        self.object_list = hits
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(NEXT, [last.score, last.rowid])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(PREVIOUS, [first.score, first.rowid])
+
+
+def search(text, cursor, per_page):
+    """Страница постов и комментариев, подходящих под запрос text."""
+    query = fts_query(text)
+    if not query:
+        return SearchPage([], False, False)
+    decoded = decode_cursor(cursor, (float, int)) if cursor else None
+    sql = (
+        'SELECT rowid, post_id, score, snippet FROM ('
+        '  SELECT rowid, post_id, bm25(posts_search) AS score,'
+        '    snippet(posts_search, 0, %s, %s, %s, %s) AS snippet'
+        '  FROM posts_search WHERE posts_search MATCH %s'
+        ')'
+    )
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, query]
+    direction = NEXT
+    if decoded is None:
+        sql += ' ORDER BY score, rowid'
+    else:
+        direction, (score, rowid) = decoded
+        if direction == NEXT:
+            sql += (
+                ' WHERE score > %s OR (score = %s AND rowid > %s)'
+                ' ORDER BY score, rowid'
+            )
+        else:
+            sql += (
+                ' WHERE score < %s OR (score = %s AND rowid < %s)'
+                ' ORDER BY score DESC, rowid DESC'
+            )
+        params += [score, score, rowid]
+    sql += ' LIMIT %s'
+    params.append(per_page + 1)
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+    if not rows and decoded is not None:
+        # Курсор за последним результатом или соседние записи удалены.
+        return search(text, None, per_page)
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == PREVIOUS:
+        rows.reverse()
+        has_next, has_previous = True, more
+    else:
+        has_next, has_previous = more, decoded is not None
+    posts = Post.objects.previews().in_bulk(
+        {post_id for _, post_id, _, _ in rows}
+    )
+    hits = [
+        SearchHit(
+            post=posts[post_id],
+            comment_id=rowid // 2 if rowid & 1 == COMMENT else None,
+            snippet=highlight(snippet),
+            score=score,
+            rowid=rowid,
+        )
+        for rowid, post_id, score, snippet in rows
+        if post_id in posts
+    ]
+    return SearchPage(hits, has_next, has_previous)
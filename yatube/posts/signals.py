@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from jobs.queue import enqueue
+
+from . import feeds, jobs
+from .cache import bump_tags, post_tags
+from .counters import change, change_media_refs, change_user_stats
+from .models import Comment, Follow, Group, Post, UserStats
+from .thumbnails import QUEUE as THUMBNAILS_QUEUE, image_metadata
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance.old_image = ''
+        instance.image_changed = bool(instance.image)
+        image_changing(instance)
+        return
+    old_group_id, old_image = Post.objects.filter(
+        pk=instance.pk
+    ).values_list('group_id', 'image').first() or (None, '')
+    instance.old_image = old_image
+    instance.image_changed = old_image != instance.image.name
+    if instance.image_changed:
+        image_changing(instance)
+    if old_group_id != instance.group_id:
+        change(Group.objects.filter(pk=old_group_id), posts_count=-1)
+        change(Group.objects.filter(pk=instance.group_id), posts_count=1)
+        if old_group_id:
+            bump_tags(*post_tags(instance, group_id=old_group_id))
+
+
+def image_changing(post):
+    """Записывает метаданные новой картинки поста.
+
+    Миниатюры привязаны к содержимому: если такую же картинку уже
+    загружали, пост получает готовые варианты, иначе шаблоны показывают
+    заглушку, пока их не создаст фоновая задача.
+    """
+    for field, value in image_metadata(post.image).items():
+        setattr(post, field, value)
+    post.image_variants = jobs.twin_variants(
+        post.image_hash, stored_name(post)
+    )
+    post.thumbnails_ready = bool(post.image_variants)
+
+
+def stored_name(post):
+    """Имя, под которым картинка поста ляжет в хранилище: новый файл
+    сохраняется позже, при записи поста."""
+    image = post.image
+    if not image or image._committed:
+        return image.name
+    return image.storage.hashed_name(
+        image.field.generate_filename(post, image.name), post.image_hash
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    bump_tags(*post_tags(instance))
+    if getattr(instance, 'image_changed', False):
+        # Имя файла известно только после сохранения: оно по хэшу.
+        change_media_refs(instance.image.name, 1)
+        change_media_refs(instance.old_image, -1)
+    if (
+        getattr(instance, 'image_changed', False)
+        and instance.image
+        and not instance.thumbnails_ready
+    ):
+        enqueue(
+            jobs.thumbnails,
+            queue=THUMBNAILS_QUEUE,
+            post_id=instance.pk,
+            image=instance.image.name,
+        )
+    if created:
+        change_user_stats(instance.author_id, posts_count=1)
+        change(Group.objects.filter(pk=instance.group_id), posts_count=1)
+        fan_out(instance)
+        feeds.forget_author_stream(instance.author_id)
+
+
+def fan_out(post):
+    """Раскладывает пост по лентам сразу или, если подписчиков много,
+    в фоновой задаче, чтобы не задерживать ответ автору."""
+    followers = UserStats.objects.filter(user_id=post.author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+    if followers <= settings.POSTS_FANOUT_INLINE_LIMIT:
+        feeds.fan_out(post)
+    else:
+        enqueue(jobs.fan_out, priority=10, post_id=post.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_tags(*post_tags(instance))
+    change_media_refs(instance.image.name, -1)
+    change_user_stats(instance.author_id, posts_count=-1)
+    change(Group.objects.filter(pk=instance.group_id), posts_count=-1)
+    feeds.forget_author_stream(instance.author_id)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    bump_tags(f'group:{instance.slug}')
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    bump_tags(f'post:{instance.post_id}')
+    if created:
+        change(Post.objects.filter(pk=instance.post_id), comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_tags(f'post:{instance.post_id}')
+    change(Post.objects.filter(pk=instance.post_id), comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    bump_tags(f'author:{instance.author_id}', f'feed:{instance.user_id}')
+    if created and instance.user_id and instance.author_id:
+        change_user_stats(instance.user_id, following_count=1)
+        change_user_stats(instance.author_id, followers_count=1)
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_tags(f'author:{instance.author_id}', f'feed:{instance.user_id}')
+    if instance.user_id and instance.author_id:
+        change_user_stats(instance.user_id, following_count=-1)
+        change_user_stats(instance.author_id, followers_count=-1)
+        feeds.trim(instance.user_id, instance.author_id)
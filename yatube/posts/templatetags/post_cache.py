@@ -0,0 +1,31 @@
+from django import template
+from django.conf import settings
+
+from ..cache import get_or_build
+
+register = template.Library()
+
+
+class CachedPostsNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        request = context.get('request')
+        key = getattr(request, 'posts_cache_key', None)
+        if key is None:
+            return self.nodelist.render(context)
+        return get_or_build(
+            f'posts:fragment:{key}',
+            request.posts_cache_version,
+            lambda: self.nodelist.render(context),
+            settings.POSTS_PAGE_CACHE_TIMEOUT,
+        )
+
+
+@register.tag
+def cached_posts(parser, token):
+    """Кэширует список постов страницы, обёрнутой cache_page_by_tags."""
+    nodelist = parser.parse(('endcached_posts',))
+    parser.delete_first_token()
+    return CachedPostsNode(nodelist)
@@ -0,0 +1,50 @@
+from django import template
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+register = template.Library()
+
+MIME_TYPES = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+}
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post):
+    """<picture> с вариантами картинки поста разной ширины.
+
+    Последний формат в списке — исходный: он идёт в <img> для браузеров
+    без поддержки остальных, прочие форматы — в <source>.
+    """
+    by_format = {}
+    for variant in post.variants:
+        variant['url'] = default_storage.url(variant['name'])
+        by_format.setdefault(variant['format'], []).append(variant)
+    formats = list(by_format)
+    fallback = by_format[formats[-1]]
+    # В src — вариант ширины карточки, размеры задают место под картинку.
+    img = min(
+        fallback,
+        key=lambda variant: abs(variant['width'] - settings.POSTS_IMAGE_WIDTH)
+    )
+    return {
+        'sources': [
+            {
+                'type': MIME_TYPES.get(image_format, ''),
+                'srcset': srcset(by_format[image_format]),
+            }
+            for image_format in formats[:-1]
+        ],
+        'img': img,
+        'srcset': srcset(fallback),
+        'sizes': settings.POSTS_IMAGE_SIZES,
+    }
+
+
+def srcset(variants):
+    return ', '.join(
+        f"{variant['url']} {variant['width']}w" for variant in variants
+    )
@@ -1,15 +1,28 @@
+import os
 import tempfile
 import shutil
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from ..models import Post, Comment
+from jobs.models import Job
+from jobs.queue import run_pending
+from ..management.commands.collect_orphans import (
+    Command as CollectOrphans
+)
+from ..models import MediaFile, Post, Comment, image_storage
+from ..thumbnails import QUEUE as THUMBNAILS_QUEUE
 
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+# Картинки хранятся под SHA-256 содержимого в подкаталогах.
+IMAGE_NAME = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
 
 User = get_user_model()
 
@@ -72,9 +85,9 @@ class PostFormTests(TestCase):
             self.user,
             'При создании поста поле author не соответсвует ожидаемому'
         )
-        self.assertEqual(
+        self.assertRegex(
             str(new_post.image),
-            'posts/small.gif',
+            IMAGE_NAME,
             'При создании поста поле image не соответсвует ожидаемому'
         )
 
@@ -114,12 +127,231 @@ class PostFormTests(TestCase):
             self.user,
             'При обновлении поста поле author не соответсвует ожидаемому'
         )
-        self.assertEqual(
+        self.assertRegex(
             str(updating_post.image),
-            'posts/second_small.gif',
+            IMAGE_NAME,
             'При обновлении поста поле image не соответсвует ожидаемому'
         )
 
+    def test_thumbnails_generated_in_background(self):
+        """Миниатюры загруженной картинки создаёт воркер, а до этого
+        на странице поста показывается заглушка."""
+        uploaded = SimpleUploadedFile(
+            name='thumb_small.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Post with thumbnail', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Post with thumbnail')
+        self.assertFalse(post.thumbnails_ready)
+        self.assertTrue(
+            Job.objects.filter(queue=THUMBNAILS_QUEUE, name__endswith=(
+                '.thumbnails'
+            )).exists()
+        )
+        address = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertContains(
+            self.authorized_client.get(address), 'Картинка обрабатывается'
+        )
+
+        run_pending(queues=[THUMBNAILS_QUEUE])
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnails_ready)
+        self.assertEqual(
+            [(variant['format'], variant['width'])
+             for variant in post.variants if variant['format'] == 'gif'],
+            [('gif', 480), ('gif', 960), ('gif', 1440)],
+        )
+        response = self.authorized_client.get(address)
+        self.assertNotContains(response, 'Картинка обрабатывается')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, ' 1440w"')
+
+    @override_settings(POSTS_IMAGE_WIDTHS=(480,))
+    def test_image_metadata_and_shared_thumbnails(self):
+        """При загрузке запоминаются размеры, объём и хэш картинки,
+        а повторная загрузка той же картинки получает готовые миниатюры
+        без фоновой задачи."""
+        first = Post.objects.create(
+            text='First copy',
+            author=self.user,
+            image=SimpleUploadedFile('a.gif', self.small_gif, 'image/gif'),
+        )
+        first.refresh_from_db()
+        self.assertEqual((first.image_width, first.image_height), (2, 1))
+        self.assertEqual(first.image_size, len(self.small_gif))
+        self.assertEqual(len(first.image_hash), 64)
+        run_pending(queues=[THUMBNAILS_QUEUE])
+        first.refresh_from_db()
+
+        second = Post.objects.create(
+            text='Second copy',
+            author=self.user,
+            image=SimpleUploadedFile('b.gif', self.small_gif, 'image/gif'),
+        )
+        self.assertEqual(second.image_hash, first.image_hash)
+        self.assertTrue(second.thumbnails_ready)
+        self.assertEqual(second.variants, first.variants)
+        self.assertFalse(Job.objects.filter(status=Job.QUEUED).exists())
+
+        # То же содержимое под другим расширением — другой файл со
+        # своими миниатюрами.
+        renamed = Post.objects.create(
+            text='Renamed copy',
+            author=self.user,
+            image=SimpleUploadedFile('c.jpg', self.small_gif, 'image/gif'),
+        )
+        self.assertEqual(renamed.image_hash, first.image_hash)
+        self.assertNotEqual(renamed.image.name, first.image.name)
+        self.assertFalse(renamed.thumbnails_ready)
+        self.assertTrue(Job.objects.filter(status=Job.QUEUED).exists())
+
+        second.image = ''
+        second.save(update_fields=['image'])
+        second.refresh_from_db()
+        self.assertEqual(second.image_hash, '')
+        self.assertIsNone(second.image_width)
+        self.assertFalse(second.thumbnails_ready)
+
+    @override_settings(POSTS_IMAGE_WIDTHS=(480,))
+    def test_identical_images_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом под хэшем, а
+        gc_media удаляет его, когда не остаётся ссылок."""
+        posts = [
+            Post.objects.create(
+                text=f'Copy {name}',
+                author=self.user,
+                image=SimpleUploadedFile(name, self.small_gif, 'image/gif'),
+            )
+            for name in ('one.GIF', 'two.gif')
+        ]
+        name = posts[0].image.name
+        digest = posts[0].image_hash
+        self.assertEqual(
+            name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        )
+        self.assertEqual(posts[1].image.name, name)
+        self.assertEqual(image_storage.listdir(f'posts/{digest[:2]}/'
+                                               f'{digest[2:4]}')[1],
+                         [f'{digest}.gif'])
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 2)
+
+        run_pending(queues=[THUMBNAILS_QUEUE])
+        thumbnail = Post.objects.get(pk=posts[0].pk).variants[0]['name']
+        for post in posts:
+            post.delete()
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 0)
+        out = StringIO()
+        call_command('gc_media', grace=0, dry_run=True, stdout=out)
+        self.assertIn(name, out.getvalue())
+        self.assertTrue(image_storage.exists(name))
+
+        call_command('gc_media', grace=0, stdout=StringIO())
+        self.assertFalse(image_storage.exists(name))
+        self.assertFalse(image_storage.exists(thumbnail))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    @override_settings(POSTS_IMAGE_WIDTHS=(480,))
+    def test_collect_orphans_command(self):
+        """collect_orphans находит картинки без постов, их миниатюры и
+        миниатюры без записей sorl.thumbnail, не трогая живые файлы."""
+        kept = Post.objects.create(
+            text='Kept',
+            author=self.user,
+            image=SimpleUploadedFile('kept.gif', self.small_gif, 'image/gif'),
+        )
+        lost = Post.objects.create(
+            text='Lost',
+            author=self.user,
+            image=SimpleUploadedFile(
+                'lost.gif', self.small_gif + b'\0', 'image/gif'
+            ),
+        )
+        run_pending(queues=[THUMBNAILS_QUEUE])
+        lost.refresh_from_db()
+        lost_thumbnail = lost.variants[0]['name']
+        # Картинку заменили в обход сигналов, файл остался на диске.
+        Post.objects.filter(pk=lost.pk).update(image='')
+        stray = default_storage.save(
+            'cache/ab/cd/stray.jpg', ContentFile(b'x')
+        )
+        quarantine = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, quarantine, ignore_errors=True)
+
+        out = StringIO()
+        call_command('collect_orphans', dry_run=True, min_age=0, stdout=out)
+        self.assertIn(lost.image.name, out.getvalue())
+        self.assertIn(stray, out.getvalue())
+        self.assertNotIn(kept.image.name, out.getvalue())
+        self.assertTrue(image_storage.exists(lost.image.name))
+
+        out = StringIO()
+        call_command(
+            'collect_orphans', quarantine=quarantine, min_age=0, rate=0,
+            stdout=out,
+        )
+        self.assertIn('Перенесено в карантин картинок: 1', out.getvalue())
+        self.assertFalse(image_storage.exists(lost.image.name))
+        self.assertTrue(
+            os.path.exists(os.path.join(quarantine, lost.image.name))
+        )
+        self.assertFalse(default_storage.exists(lost_thumbnail))
+        self.assertFalse(default_storage.exists(stray))
+        self.assertTrue(image_storage.exists(kept.image.name))
+        kept.refresh_from_db()
+        for variant in kept.variants:
+            self.assertTrue(default_storage.exists(variant['name']))
+
+    def test_collect_orphans_spares_reupload(self):
+        """Картинку, загруженную снова между обходом и удалением,
+        collect_orphans не удаляет и не теряет её учёт ссылок."""
+        orphan = Post.objects.create(
+            text='Orphan',
+            author=self.user,
+            image=SimpleUploadedFile('o.gif', self.small_gif, 'image/gif'),
+        )
+        name = orphan.image.name
+        orphan.delete()
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 0)
+        reuploaded = []
+
+        def reupload(command, count=1):
+            if not reuploaded:
+                reuploaded.append(Post.objects.create(
+                    text='Again',
+                    author=self.user,
+                    image=SimpleUploadedFile(
+                        'again.gif', self.small_gif, 'image/gif'
+                    ),
+                ))
+
+        with mock.patch.object(CollectOrphans, 'throttle', reupload):
+            call_command('collect_orphans', min_age=0, stdout=StringIO())
+        self.assertEqual(reuploaded[0].image.name, name)
+        self.assertTrue(image_storage.exists(name))
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
+
+    @override_settings(POSTS_IMAGE_WIDTHS=(480,))
+    def test_queue_thumbnails_command(self):
+        """queue_thumbnails создаёт варианты картинок старых постов."""
+        post = Post.objects.create(
+            text='Old post',
+            author=self.user,
+            image=SimpleUploadedFile('old.gif', self.small_gif, 'image/gif'),
+        )
+        Post.objects.filter(pk=post.pk).update(
+            thumbnails_ready=True, image_variants=''
+        )
+        Job.objects.all().delete()
+        call_command('queue_thumbnails', stdout=StringIO())
+        run_pending(queues=[THUMBNAILS_QUEUE])
+        post.refresh_from_db()
+        self.assertIn(480, [variant['width'] for variant in post.variants])
+
 
 class CommentFormTests(TestCase):
     def setUp(self):
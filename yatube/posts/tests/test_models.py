@@ -1,6 +1,11 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from ..models import Group, Post
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from unittest import skipUnless
+from ..models import Comment, Follow, Group, Post, UserStats
 
 
 User = get_user_model()
@@ -96,3 +101,149 @@ class GroupModelTest(TestCase):
                     expected_value,
                     'verbose_name модели Group не соответствует ожидаемому'
                 )
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='CounterAuthor')
+        self.reader = User.objects.create_user(username='CounterReader')
+        self.group = Group.objects.create(
+            title='Counter group',
+            slug='counter-group',
+            description='Group for testing counters',
+        )
+        self.post = Post.objects.create(
+            text='Post for testing counters',
+            author=self.author,
+            group=self.group,
+        )
+
+    def refresh(self):
+        for obj in (self.post, self.group, self.author.stats,
+                    self.reader.stats):
+            obj.refresh_from_db()
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Comment'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.refresh()
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(self.reader.stats.following_count, 1)
+
+        comment.delete()
+        follow.delete()
+        self.refresh()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.author.stats.followers_count, 0)
+        self.assertEqual(self.reader.stats.following_count, 0)
+
+    def test_group_counter_follows_post_edit(self):
+        """Перенос поста в другую группу переносит и счётчик."""
+        other_group = Group.objects.create(
+            title='Other counter group',
+            slug='other-counter-group',
+            description='Group for testing counters',
+        )
+        self.post.group = other_group
+        self.post.save()
+        self.group.refresh_from_db()
+        other_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(other_group.posts_count, 1)
+
+    def test_repair_counters_command(self):
+        """repair_counters исправляет разошедшиеся счётчики."""
+        Post.objects.bulk_create([
+            Post(text='Bulk post', author=self.author, group=self.group)
+        ])
+        UserStats.objects.filter(user=self.reader).delete()
+        out = StringIO()
+        call_command('repair_counters', stdout=out)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 2)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 2
+        )
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
+        self.assertIn('groups: исправлено 1', out.getvalue())
+
+
+class RenderedTextTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='RenderAuthor')
+
+    def test_html_rendered_on_save(self):
+        """HTML текста и превью готовится при сохранении поста."""
+        post = Post.objects.create(
+            text='Первая строка\n\n<b>вторая</b>', author=self.author
+        )
+        expected = '<p>Первая строка</p>\n\n<p>&lt;b&gt;вторая&lt;/b&gt;</p>'
+        self.assertEqual(post.text_html, expected)
+        self.assertEqual(post.excerpt_html, expected)
+
+        post.text = 'Новый текст'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p>Новый текст</p>')
+
+    @override_settings(POSTS_EXCERPT_LENGTH=10)
+    def test_excerpt_truncated(self):
+        """Превью обрезается до POSTS_EXCERPT_LENGTH символов."""
+        post = Post.objects.create(
+            text='Очень длинный текст поста', author=self.author
+        )
+        self.assertEqual(post.excerpt_html, '<p>Очень дли…</p>')
+        self.assertEqual(post.text_html, '<p>Очень длинный текст поста</p>')
+
+    def test_render_posts_command(self):
+        """render_posts заполняет HTML постов, созданных в обход save."""
+        Post.objects.bulk_create([Post(text='Bulk post', author=self.author)])
+        out = StringIO()
+        call_command('render_posts', stdout=out)
+        post = Post.objects.get(text='Bulk post')
+        self.assertEqual(post.text_html, '<p>Bulk post</p>')
+        self.assertIn('Перерисовано постов: 1', out.getvalue())
+
+
+class HotPathIndexesTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='IndexAuthor')
+        self.reader = User.objects.create_user(username='IndexReader')
+        self.group = Group.objects.create(
+            title='Index group',
+            slug='index-group',
+            description='Group for testing indexes',
+        )
+        for i in range(3):
+            post = Post.objects.create(
+                text=f'Index post {i}', author=self.author, group=self.group
+            )
+            Comment.objects.create(
+                post=post, author=self.reader, text='Comment'
+            )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на того же автора невозможна."""
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=self.reader, author=self.author)
+
+    @skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+    def test_hot_queries_use_indexes(self):
+        """Списки и комментарии читаются по индексам без сортировки."""
+        out = StringIO()
+        call_command('explain_queries', repeat=1, stdout=out)
+        plans = out.getvalue()
+        for index in ('posts_post_author_date', 'posts_post_group_date',
+                      'posts_comment_post_created'):
+            with self.subTest(index=index):
+                self.assertIn(index, plans)
+        # SQLite называет индекс уникального ограничения сам.
+        self.assertIn('INDEX sqlite_autoindex_posts_follow', plans)
+        self.assertNotIn('TEMP B-TREE', plans)
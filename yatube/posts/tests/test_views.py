@@ -1,17 +1,29 @@
+import base64
+import gzip
+import json
 import tempfile
 import shutil
+import time
+import warnings
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django import forms
 from django.test import Client, TestCase, override_settings
-from django.urls import reverse
-from django.conf import settings
+from django.urls import resolve, reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
-from ..models import Post, Group, Comment, Follow
+from ..cache import cache_metrics, get_or_build, tag_versions
+from ..feeds import author_streams
+from ..models import Post, Group, Comment, Follow, TimelineEntry
+from ..paginators import NEXT, PREVIOUS, encode_cursor
+from ..search import install_triggers
 from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 User = get_user_model()
 
@@ -293,17 +305,27 @@ class PostPagesTests(TestCase):
 
 class CacheTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
+        self.user = User.objects.create_user(username='SomeName')
+        self.group = Group.objects.create(
+            title='Cache group',
+            slug='cache-group',
+            description='Group for testing cache',
+        )
+        self.post = Post.objects.create(
+            text='Post for testing cache',
+            author=self.user,
+            group=self.group,
+        )
 
     def test_index_page_cache(self):
         """Тестирование кэша главной страницы"""
-        post = Post.objects.create(
-            text='Post for testing cache',
-            author=User.objects.create_user(username='SomeName'),
-        )
         response = self.guest_client.get(reverse('posts:index'))
         response_content = response.content
-        post.delete()
+        Post.objects.filter(pk=self.post.pk).update(
+            text='Changed quietly', excerpt_html='<p>Changed quietly</p>'
+        )
         response = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(
             response_content,
@@ -315,3 +337,736 @@ class CacheTests(TestCase):
             response_content,
             response.content
         )
+
+    def test_list_pages_invalidated_on_write(self):
+        """Запись поста сбрасывает кэш только связанных с ним страниц."""
+        other_group = Group.objects.create(
+            title='Other cache group',
+            slug='other-cache-group',
+            description='Group for testing cache',
+        )
+        addresses = {
+            reverse('posts:index'): True,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}):
+                True,
+            reverse('posts:profile', kwargs={'username': self.user.username}):
+                True,
+            reverse('posts:group_list', kwargs={'slug': other_group.slug}):
+                False,
+        }
+        before = {
+            address: self.guest_client.get(address).content
+            for address in addresses
+        }
+        self.post.text = 'Edited post for testing cache'
+        self.post.save()
+        for address, changed in addresses.items():
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertEqual(
+                    response.content != before[address], changed
+                )
+                self.assertEqual(
+                    'Edited post' in response.content.decode(), changed
+                )
+
+    def test_authorized_pages_keep_own_header(self):
+        """Авторизованный пользователь получает список из кэша,
+        но шапку со своим именем."""
+        other = User.objects.create_user(username='OtherCacheUser')
+        first_client = Client()
+        first_client.force_login(self.user)
+        second_client = Client()
+        second_client.force_login(other)
+        address = reverse('posts:index')
+
+        first_client.get(address)
+        Post.objects.filter(pk=self.post.pk).update(text='Changed quietly')
+        content = second_client.get(address).content.decode()
+
+        self.assertIn('Пользователь: OtherCacheUser', content)
+        self.assertNotIn('Пользователь: SomeName', content)
+        self.assertIn('Post for testing cache', content)
+        self.assertNotIn('Changed quietly', content)
+
+    def test_cached_page_stored_compressed(self):
+        """Страница хранится в кэше сжатой: попадание не сжимается
+        заново, а клиент без gzip получает её разжатой."""
+        address = reverse('posts:index')
+        with mock.patch('gzip.compress', wraps=gzip.compress) as compress:
+            first = self.guest_client.get(
+                address, HTTP_ACCEPT_ENCODING='gzip'
+            )
+            second = self.guest_client.get(
+                address, HTTP_ACCEPT_ENCODING='gzip'
+            )
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertEqual(second.content, first.content)
+        self.assertIn(
+            'Post for testing cache', gzip.decompress(second.content).decode()
+        )
+
+        plain = self.guest_client.get(address)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(plain.content, gzip.decompress(second.content))
+        # Побайтно разные тела делят только слабый ETag.
+        self.assertTrue(second['ETag'].startswith('W/"'))
+        self.assertEqual(plain['ETag'], second['ETag'])
+        refused = self.guest_client.get(
+            address, HTTP_ACCEPT_ENCODING='gzip;q=0, identity'
+        )
+        self.assertNotIn('Content-Encoding', refused)
+
+    def test_follow_feeds_not_shared_while_locked(self):
+        """Лента подписок одного пользователя не достаётся другому, даже
+        когда её запись пересобирает другой процесс."""
+        alice = User.objects.create_user(username='alice')
+        bob = User.objects.create_user(username='bob')
+        carol = User.objects.create_user(username='carol')
+        Follow.objects.create(user=alice, author=self.user)
+        Follow.objects.create(user=bob, author=carol)
+        Post.objects.create(text='Only for bob', author=carol)
+        alice_client = Client()
+        alice_client.force_login(alice)
+        bob_client = Client()
+        bob_client.force_login(bob)
+        address = reverse('posts:follow_index')
+        alice_client.get(address)
+
+        add = cache.add
+
+        def locked(key, *args, **kwargs):
+            if key.endswith(':lock'):
+                return False
+            return add(key, *args, **kwargs)
+
+        with mock.patch.object(cache, 'add', side_effect=locked):
+            content = bob_client.get(address).content.decode()
+        self.assertIn('Only for bob', content)
+        self.assertNotIn('Post for testing cache', content)
+
+    def test_comment_bumps_post_tag(self):
+        """Комментарий сбрасывает тег своего поста."""
+        version = tag_versions([f'post:{self.post.pk}'])
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Comment'
+        )
+        self.assertNotEqual(
+            tag_versions([f'post:{self.post.pk}']), version
+        )
+
+    def test_tag_keys_safe_for_any_slug(self):
+        """Slug группы с пробелами и кириллицей не портит ключ кэша."""
+        group = Group.objects.create(
+            title='Котики', slug='котики и собаки', description='Котики'
+        )
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            version = tag_versions([f'group:{group.slug}'])
+            Post.objects.create(
+                text='Котик', author=self.user, group=group
+            )
+            self.assertNotEqual(
+                tag_versions([f'group:{group.slug}']), version
+            )
+
+
+@override_settings(POSTS_PAGINATION='cursor')
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='CursorUser')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Cursor group',
+            slug='cursor-group',
+            description='Group for testing cursor pagination',
+        )
+        for i in range(13):
+            Post.objects.create(
+                text=f'{i}', author=self.user, group=self.group
+            )
+
+    def test_cursor_pages(self):
+        """Курсорная пагинация листает вперёд и назад без пропусков."""
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for address in addresses:
+            with self.subTest(address=address):
+                cache.clear()
+                first = self.authorized_client.get(address).context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertFalse(first.has_previous())
+
+                second = self.authorized_client.get(
+                    address, {'cursor': first.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                self.assertEqual(
+                    [post.text for post in first]
+                    + [post.text for post in second],
+                    [str(i) for i in reversed(range(13))]
+                )
+
+                back = self.authorized_client.get(
+                    address, {'cursor': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                self.assertFalse(back.has_previous())
+
+    def test_cursor_pages_skip_count(self):
+        """Курсорная пагинация не выполняет COUNT(*)."""
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(reverse('posts:index'))
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()]
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор возвращает первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': '!!broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_cursor_beyond_ends_returns_first_page(self):
+        """Курсор за последним или перед первым постом возвращает первую
+        страницу, а не пустую."""
+        oldest = Post.objects.order_by('pub_date', 'id').first()
+        newest = Post.objects.order_by('pub_date', 'id').last()
+        cursors = [
+            encode_cursor(NEXT, [oldest.pub_date, oldest.pk]),
+            encode_cursor(PREVIOUS, [newest.pub_date, newest.pk]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.authorized_client.get(
+                    reverse('posts:index'), {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 200)
+                page = response.context['page_obj']
+                self.assertEqual(page[0], newest)
+                self.assertFalse(page.has_previous())
+
+    def test_crafted_cursor_returns_first_page(self):
+        """Курсор с чужими типами значений возвращает первую страницу."""
+        payloads = [
+            ['n', 'bad', 'x'],
+            ['n', '2021-99-99T00:00:00', 1],
+            ['n', '2021-01-01T00:00:00', 1],
+            ['n', {}, 1],
+            ['n', None, None],
+            ['p', 5, 5],
+            ['n', '2021-01-01T00:00:00+00:00', True],
+            ['n', '2021-01-01T00:00:00+00:00'],
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                cursor = base64.urlsafe_b64encode(
+                    json.dumps(payload).encode()
+                ).decode()
+                response = self.authorized_client.get(
+                    reverse('posts:index'), {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 200)
+                page = response.context['page_obj']
+                self.assertFalse(page.has_previous())
+                self.assertEqual(len(page), 10)
+
+
+class TimelineFeedTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='TimelineAuthor')
+        self.user = User.objects.create_user(username='TimelineReader')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.old_post = Post.objects.create(
+            text='Post before following', author=self.author
+        )
+
+    def test_follow_backfills_and_new_post_fans_out(self):
+        """Подписка заполняет ленту, новый пост попадает в неё сразу."""
+        self.authorized_client.get(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': self.author.username}
+            )
+        )
+        new_post = Post.objects.create(
+            text='Post after following', author=self.author
+        )
+        self.assertEqual(
+            list(
+                TimelineEntry.objects.filter(user=self.user)
+                .order_by('-pub_date').values_list('post', flat=True)
+            ),
+            [new_post.pk, self.old_post.pk]
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.old_post]
+        )
+
+    def test_unfollow_trims_timeline(self):
+        """Отписка убирает посты автора из ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.authorized_client.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.author.username}
+            )
+        )
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user))
+
+    @override_settings(POSTS_FOLLOW_FEED='join')
+    def test_join_feed_engine(self):
+        """Лента подписок строится JOIN-запросом при POSTS_FOLLOW_FEED=join."""
+        Follow.objects.create(user=self.user, author=self.author)
+        TimelineEntry.objects.all().delete()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.old_post])
+
+
+@override_settings(POSTS_FOLLOW_FEED='merge', POSTS_PER_PAGE=3)
+class MergedFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='MergeReader')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.authors = [
+            User.objects.create_user(username=f'MergeAuthor{i}')
+            for i in range(2)
+        ]
+        for author in self.authors:
+            Follow.objects.create(user=self.user, author=author)
+        self.posts = [
+            Post.objects.create(
+                text=f'Merged post {i}', author=self.authors[i % 2]
+            )
+            for i in range(5)
+        ]
+
+    def test_merged_feed_pages(self):
+        """Лента слияния отдаёт посты всех авторов от новых к старым."""
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[:1:-1]
+        )
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), {'page': 2}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[1::-1]
+        )
+
+    @override_settings(POSTS_AUTHOR_STREAM_SIZE=2)
+    def test_missing_streams_loaded_in_one_query(self):
+        """Потоки всех авторов, которых нет в кэше, читаются одним
+        запросом и обрезаются по POSTS_AUTHOR_STREAM_SIZE."""
+        silent = User.objects.create_user(username='MergeSilent')
+        author_ids = [author.pk for author in self.authors] + [silent.pk]
+        with self.assertNumQueries(1):
+            streams = author_streams(author_ids)
+        self.assertEqual(
+            sorted(streams),
+            sorted([
+                [],
+                [(post.pub_date, post.pk) for post in self.posts[4::-2][:2]],
+                [(post.pub_date, post.pk) for post in self.posts[3::-2][:2]],
+            ]),
+        )
+        with self.assertNumQueries(0):
+            author_streams(author_ids)
+
+    def test_new_post_resets_author_stream(self):
+        """Новый пост автора сразу виден в ленте слияния."""
+        self.authorized_client.get(reverse('posts:follow_index'))
+        post = Post.objects.create(text='Fresh post', author=self.authors[0])
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+
+@override_settings(POSTS_CACHE_XFETCH_BETA=0)
+class StampedeProtectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_stale_copy_served_while_locked(self):
+        """Пока другой процесс пересобирает запись, отдаётся старая копия."""
+        get_or_build('stampede', 'v1', lambda: 'old', 60)
+        cache.add('stampede:lock', 1)
+        value = get_or_build('stampede', 'v2', lambda: 'new', 60)
+        self.assertEqual(value, 'old')
+        self.assertEqual(cache_metrics()['stale'], 1)
+
+        cache.delete('stampede:lock')
+        value = get_or_build('stampede', 'v2', lambda: 'new', 60)
+        self.assertEqual(value, 'new')
+        self.assertEqual(cache_metrics()['rebuild'], 1)
+        self.assertIsNone(cache.get('stampede:lock'))
+
+    def test_fresh_value_is_not_rebuilt(self):
+        """Свежая запись не пересобирается."""
+        builds = []
+        for _ in range(3):
+            get_or_build('fresh', 'v1', lambda: builds.append(1), 60)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(cache_metrics()['hit'], 2)
+
+    @override_settings(POSTS_CACHE_XFETCH_BETA=10 ** 9)
+    def test_early_recompute(self):
+        """XFetch пересобирает запись до истечения срока."""
+        get_or_build('early', 'v1', lambda: time.sleep(0.01) or 'old', 60)
+        value = get_or_build('early', 'v1', lambda: 'new', 60)
+        self.assertEqual(value, 'new')
+        self.assertEqual(cache_metrics()['early'], 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='ConditionalUser')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Conditional group',
+            slug='conditional-group',
+            description='Group for testing conditional GET',
+        )
+        self.post = Post.objects.create(
+            text='Post for testing conditional GET',
+            author=self.user,
+            group=self.group,
+        )
+        self.addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def test_not_modified_until_write(self):
+        """Страница отвечает 304, пока её данные не изменились."""
+        for client in (Client(), self.authorized_client):
+            for address in self.addresses:
+                with self.subTest(address=address):
+                    response = client.get(address)
+                    self.assertTrue(response.has_header('Last-Modified'))
+                    self.assertIn('no-cache', response['Cache-Control'])
+                    etag = response['ETag']
+                    response = client.get(address, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 304)
+
+                    Comment.objects.create(
+                        post=self.post, author=self.user, text='Comment'
+                    )
+                    self.post.save()
+                    response = client.get(address, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_etag_differs_between_users(self):
+        """ETag учитывает пользователя, которому отрисована шапка."""
+        address = reverse('posts:index')
+        anonymous = Client().get(address)
+        authorized = self.authorized_client.get(address)
+        self.assertNotEqual(anonymous['ETag'], authorized['ETag'])
+        self.assertIn('private', authorized['Cache-Control'])
+
+    def test_relogin_gets_fresh_page(self):
+        """После повторного входа страница с формой не отдаётся как 304
+        со старым CSRF-токеном."""
+        client = Client()
+        client.force_login(self.user)
+        address = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        etag = client.get(address)['ETag']
+        self.assertEqual(
+            client.get(address, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        client.logout()
+        client.force_login(self.user)
+        response = client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(POSTS_EXCERPT_LENGTH=20)
+class PreviewListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='PreviewUser')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Preview group',
+            slug='preview-group',
+            description='Group for testing previews',
+        )
+        self.long_post = Post.objects.create(
+            text='Длинный пост, который не помещается в превью',
+            author=self.user,
+            group=self.group,
+        )
+        self.short_post = Post.objects.create(
+            text='Короткий пост', author=self.user, group=self.group
+        )
+        Follow.objects.create(
+            user=User.objects.create_user(username='PreviewReader'),
+            author=self.user,
+        )
+
+    def test_lists_skip_full_text(self):
+        """Списки не загружают полный текст постов."""
+        reader = Client()
+        reader.force_login(User.objects.get(username='PreviewReader'))
+        addresses = {
+            reverse('posts:index'): self.authorized_client,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}):
+                self.authorized_client,
+            reverse('posts:profile', kwargs={'username': self.user.username}):
+                self.authorized_client,
+            reverse('posts:follow_index'): reader,
+        }
+        for address, client in addresses.items():
+            with self.subTest(address=address):
+                cache.clear()
+                page_obj = client.get(address).context['page_obj']
+                for post in page_obj:
+                    self.assertEqual(post.get_deferred_fields(), {
+                        'text', 'text_html', 'image_width', 'image_height',
+                        'image_size', 'image_hash',
+                    })
+
+    def test_read_more_link_for_truncated_excerpt(self):
+        """Ссылка «читать дальше» есть только у обрезанных превью."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'читать дальше', count=1)
+        self.assertContains(
+            response,
+            reverse('posts:post_detail', kwargs={'post_id': self.long_post.pk})
+        )
+        self.assertNotContains(response, 'не помещается в превью')
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='BudgetReader')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        self.group = Group.objects.create(
+            title='Budget group',
+            slug='budget-group',
+            description='Group for testing query budget',
+        )
+        self.author = User.objects.create_user(username='BudgetAuthor')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.add_posts(3)
+        self.post = Post.objects.filter(author=self.author).first()
+        self.addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts:profile', kwargs={'username': self.author.username}
+            ),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=budget',
+        ]
+
+    def add_posts(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'BudgetUser{Post.objects.count()}'
+            )
+            Follow.objects.create(user=self.reader, author=author)
+            for post_author in (author, self.author):
+                post = Post.objects.create(
+                    text=f'Budget post {i}',
+                    author=post_author,
+                    group=self.group,
+                )
+                Comment.objects.create(
+                    post=self.post if hasattr(self, 'post') else post,
+                    author=author,
+                    text='Comment',
+                )
+
+    def query_counts(self):
+        counts = {}
+        for address in self.addresses:
+            cache.clear()
+            response = self.authorized_client.get(address)
+            self.assertEqual(response.status_code, 200)
+            counts[address] = response.wsgi_request.query_count
+        return counts
+
+    def test_views_fit_query_budget(self):
+        """Списки и страница поста укладываются в бюджет запросов,
+        который не растёт вместе с числом постов и комментариев."""
+        counts = self.query_counts()
+        self.add_posts(4)
+        for address, count in self.query_counts().items():
+            with self.subTest(address=address):
+                self.assertEqual(count, counts[address])
+                self.assertLessEqual(
+                    count, resolve(address.split('?')[0]).func.query_budget
+                )
+
+
+@override_settings(POSTS_PER_PAGE=2)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='SearchUser', is_staff=True, is_superuser=True
+        )
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(
+            text='Кошки <любят> молоко', author=self.user
+        )
+        self.other = Post.objects.create(
+            text='Собаки любят кости', author=self.user
+        )
+        self.comment = Comment.objects.create(
+            post=self.other, author=self.user, text='А кошки нет'
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def test_search_posts_and_comments(self):
+        """Поиск находит посты и комментарии и подсвечивает совпадения."""
+        hits = list(self.search('кошк'))
+        self.assertEqual(
+            {(hit.post, hit.is_comment) for hit in hits},
+            {(self.post, False), (self.other, True)},
+        )
+        post_hit = next(hit for hit in hits if not hit.is_comment)
+        self.assertEqual(
+            post_hit.snippet, '<mark>Кошки</mark> &lt;любят&gt; молоко'
+        )
+        self.assertEqual(len(self.search('"OR(')), 0)
+
+    def test_index_follows_writes(self):
+        """Индекс обновляется при изменении и удалении записей."""
+        self.post.text = 'Попугаи'
+        self.post.save()
+        self.comment.delete()
+        self.assertEqual(len(self.search('кошки')), 0)
+        self.assertEqual(
+            [hit.post for hit in self.search('попугаи')], [self.post]
+        )
+
+    def test_triggers_restored_after_table_rebuild(self):
+        """Триггеры индекса восстанавливаются после пересоздания
+        таблицы миграцией."""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_search_insert')
+        install_triggers()
+        post = Post.objects.create(text='Хомяки', author=self.user)
+        self.assertEqual([hit.post for hit in self.search('хомяки')], [post])
+
+    def test_crafted_cursor_returns_first_page(self):
+        """Курсор поиска с чужими типами значений не ломает запрос."""
+        for payload in (['n', {}, 1], ['p', 'x', None], ['n', 1.5, 2.5]):
+            with self.subTest(payload=payload):
+                cursor = base64.urlsafe_b64encode(
+                    json.dumps(payload).encode()
+                ).decode()
+                page = self.search('кошк', cursor=cursor)
+                self.assertFalse(page.has_previous())
+                self.assertEqual(len(page), 2)
+
+    def test_cursor_beyond_results_returns_first_page(self):
+        """Курсор поиска за последним результатом возвращает первую
+        страницу."""
+        for cursor in (
+            encode_cursor(NEXT, [100.0, 1000000000]),
+            encode_cursor(PREVIOUS, [-100.0, 0]),
+        ):
+            with self.subTest(cursor=cursor):
+                page = self.search('кошк', cursor=cursor)
+                self.assertEqual(len(page), 2)
+                self.assertFalse(page.has_previous())
+                self.assertIsNone(page.previous_cursor)
+
+    def test_keyset_pages(self):
+        """Результаты листаются курсором без повторов и пропусков."""
+        for i in range(3):
+            Post.objects.create(text=f'Любят {i}', author=self.user)
+        first = self.search('любят')
+        self.assertEqual(len(first), 2)
+        second = self.search('любят', cursor=first.next_cursor)
+        third = self.search('любят', cursor=second.next_cursor)
+        self.assertFalse(third.has_next())
+        rowids = [hit.rowid for page in (first, second, third)
+                  for hit in page]
+        self.assertEqual(len(set(rowids)), 5)
+        back = self.search('любят', cursor=third.previous_cursor)
+        self.assertEqual(
+            [hit.rowid for hit in back], [hit.rowid for hit in second]
+        )
+
+    def test_admin_uses_full_text_search(self):
+        """Поиск в админке идёт по индексу FTS5."""
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'кошки'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].queryset), [self.comment]
+        )
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кошки'}
+        )
+        self.assertEqual(list(response.context['cl'].queryset), [self.post])
+
+
+@override_settings(
+    POSTS_STREAM_COMMENTS_THRESHOLD=2, POSTS_STREAM_COMMENTS_CHUNK=2
+)
+class StreamingPostDetailTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Commenter')
+        self.post = Post.objects.create(
+            text='Hot post', author=self.user
+        )
+        self.address = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def test_short_discussion_rendered_at_once(self):
+        """Страница с немногими комментариями рендерится целиком."""
+        Comment.objects.create(post=self.post, author=self.user, text='One')
+        response = self.client.get(self.address)
+        self.assertFalse(response.streaming)
+        self.assertContains(response, 'One')
+
+    def test_long_discussion_streamed(self):
+        """Пост уходит первой частью, комментарии — порциями по порядку."""
+        for i in range(5):
+            Comment.objects.create(
+                post=self.post, author=self.user, text=f'Comment {i}'
+            )
+        response = self.client.get(self.address)
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 5)
+        self.assertIn('Hot post', chunks[0])
+        self.assertNotIn('Comment 0', chunks[0])
+        self.assertIn('Comment 0', chunks[1])
+        self.assertIn('Comment 1', chunks[1])
+        self.assertIn('Comment 4', chunks[3])
+        page = ''.join(chunks)
+        self.assertLess(page.index('Comment 3'), page.index('Comment 4'))
+        self.assertTrue(page.rstrip().endswith('</html>'))
+        self.assertNotIn('<!-- comments', page)
@@ -0,0 +1,89 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.images import get_image_dimensions
+from PIL import features
+from sorl.thumbnail import get_thumbnail
+
+from core.files import content_hash
+
+# Очередь задач с миниатюрами: ресайз нагружает процессор, поэтому её
+# обслуживает отдельный воркер с пулом процессов:
+#     python manage.py runworker --queue images --pool process
+QUEUE = 'images'
+
+# Кадр картинки в карточке поста: 960x339 по центру, как раньше.
+RATIO = 339 / 960
+CROP = {'crop': 'center', 'upscale': True}
+
+SOURCE_FORMATS = {
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.gif': 'GIF',
+    '.webp': 'WEBP',
+}
+
+
+# Метаданные поста без картинки или с нечитаемым файлом.
+NO_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_size': None,
+    'image_hash': '',
+}
+
+
+def image_metadata(image):
+    """Размеры, размер в байтах и SHA-256 картинки для полей Post.
+
+    Считается один раз при загрузке, чтобы шаблонам и миниатюрам не
+    приходилось открывать файл.
+    """
+    if not image:
+        return NO_METADATA
+    try:
+        image_hash, size = content_hash(image)
+        width, height = get_image_dimensions(image)
+    except (OSError, SuspiciousFileOperation):
+        return NO_METADATA
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': size,
+        'image_hash': image_hash,
+    }
+
+
+def variant_formats(image):
+    """WebP (если Pillow собран с ним) и формат исходной картинки."""
+    source = SOURCE_FORMATS.get(
+        os.path.splitext(image.name)[1].lower(), 'JPEG'
+    )
+    formats = [source]
+    if source != 'WEBP' and features.check('webp'):
+        formats.insert(0, 'WEBP')
+    return formats
+
+
+def make_thumbnails(image):
+    """Создаёт все варианты картинки заранее, вне запроса.
+
+    Возвращает их описания для Post.image_variants: формат, размеры и
+    имя файла в хранилище.
+    """
+    variants = []
+    for image_format in variant_formats(image):
+        for width in settings.POSTS_IMAGE_WIDTHS:
+            geometry = f'{width}x{round(width * RATIO)}'
+            thumbnail = get_thumbnail(
+                image, geometry, format=image_format, **CROP
+            )
+            variants.append({
+                'format': image_format.lower(),
+                'width': thumbnail.width,
+                'height': thumbnail.height,
+                'name': thumbnail.name,
+            })
+    return variants
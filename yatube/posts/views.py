@@ -1,33 +1,57 @@
+import uuid
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect, reverse
-from django.core.paginator import Paginator
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from .models import Post, Group, Follow
 from .forms import PostForm, CommentForm
-from django.views.decorators.cache import cache_page
+from .paginators import paginate
+from .feeds import merged_page, timeline_posts
+from .cache import cache_page_by_tags, condition_by_tags
+from .search import search as search_posts
+from core.decorators import query_budget
+from core.files import batched
 
 
 User = get_user_model()
 
 
-@cache_page(20)
+def profile_tags(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    return [f'author:{author_id}']
+
+
+def post_detail_tags(request, post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True
+    ).first()
+    return [f'post:{post_id}', f'author:{author_id}']
+
+
+@condition_by_tags(lambda request: ['global'])
+@cache_page_by_tags(lambda request: ['global'])
+@query_budget(2)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.previews()
+    page_obj = paginate(request, post_list)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition_by_tags(lambda request, slug: [f'group:{slug}'])
+@cache_page_by_tags(lambda request, slug: [f'group:{slug}'])
+@query_budget(3)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = group.posts.previews()
+    page_obj = paginate(request, post_list)
     context = {
         'group': group,
         'page_obj': page_obj
@@ -35,12 +59,15 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@condition_by_tags(profile_tags)
+@cache_page_by_tags(profile_tags)
+@query_budget(4)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    post_list = author.posts.previews()
+    page_obj = paginate(request, post_list)
     if request.user.is_authenticated:
         following = request.user.follower.filter(author=author).exists()
     else:
@@ -53,18 +80,64 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@condition_by_tags(post_detail_tags)
+@query_budget(2)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     form = CommentForm()
-    comments = post.comments.all()
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
         'form': form,
         'comments': comments,
     }
+    if post.comments_count > settings.POSTS_STREAM_COMMENTS_THRESHOLD:
+        return stream_comments(request, 'posts/post_detail.html', context)
     return render(request, 'posts/post_detail.html', context)
 
 
+def stream_comments(request, template_name, context):
+    """Отдаёт страницу с комментариями по частям.
+
+    Страница вокруг комментариев рендерится сразу, поэтому начало с
+    постом уходит клиенту без ожидания, а комментарии читаются из БД
+    через iterator() и рендерятся порциями, не собираясь в памяти.
+    """
+    marker = f'<!-- comments {uuid.uuid4().hex} -->'
+    page = render_to_string(
+        template_name, {**context, 'comments_marker': marker}, request
+    )
+    head, tail = page.split(marker)
+    size = settings.POSTS_STREAM_COMMENTS_CHUNK
+
+    def chunks():
+        yield head
+        comments = context['comments'].iterator(chunk_size=size)
+        for batch in batched(comments, size):
+            yield render_to_string(
+                'posts/includes/comments.html', {'comments': batch}
+            )
+        yield tail
+
+    return StreamingHttpResponse(chunks())
+
+
+# Вместе с сессией и пользователем, которых загружает шапка страницы.
+@query_budget(4)
+def search(request):
+    query = request.GET.get('q', '')
+    page_obj = search_posts(
+        query, request.GET.get('cursor'), settings.POSTS_PER_PAGE
+    )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -115,13 +188,21 @@ def add_comment(request, post_id):
 
 
 @login_required
+@cache_page_by_tags(
+    lambda request: ['global', f'feed:{request.user.pk}']
+)
+@query_budget(3)
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__user=request.user
-    )
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if settings.POSTS_FOLLOW_FEED == 'timeline':
+        post_list = timeline_posts(request.user).previews()
+        page_obj = paginate(request, post_list, keys=('feed_date', 'feed_id'))
+    elif settings.POSTS_FOLLOW_FEED == 'merge':
+        page_obj = merged_page(request.user, request.GET.get('page'))
+    else:
+        post_list = Post.objects.previews().filter(
+            author__following__user=request.user
+        )
+        page_obj = paginate(request, post_list)
     context = {
         'page_obj': page_obj,
     }
@@ -131,13 +212,10 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if (
-            request.user != author and not Follow.objects.filter(
-                user=request.user,
-                author=author
-            ).exists()
-    ):
-        Follow.objects.create(user=request.user, author=author)
+    if request.user != author:
+        # Уникальный индекс (user, author) не даст создать дубль даже
+        # при двух одновременных запросах.
+        Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username=username)
 
 
@@ -1,6 +1,10 @@
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth import get_user_model
 
+from jobs.queue import enqueue
+
+from .jobs import send_password_reset
+
 
 User = get_user_model()
 
@@ -9,3 +13,27 @@ class UserCreation(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+
+class PasswordReset(PasswordResetForm):
+    """Сброс пароля, при котором письмо отправляет фоновый воркер.
+
+    В очередь уходит только id пользователя и адрес сайта: ссылку с
+    токеном собирает задача. Токен всегда от default_token_generator.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name,
+                  context, from_email, to_email,
+                  html_email_template_name=None):
+        enqueue(
+            send_password_reset,
+            priority=20,
+            user_id=context['user'].pk,
+            domain=context['domain'],
+            site_name=context['site_name'],
+            protocol=context['protocol'],
+            subject_template_name=subject_template_name,
+            email_template_name=email_template_name,
+            from_email=from_email,
+            html_email_template_name=html_email_template_name,
+        )
@@ -5,6 +5,7 @@ from django.contrib.auth.views import (
     PasswordResetCompleteView
 )
 from . import views
+from .forms import PasswordReset
 
 app_name = 'users'
 
@@ -36,7 +37,8 @@ urlpatterns = [
     path(
         'password_reset/',
         PasswordResetView.as_view(
-            template_name='users/password_reset_form.html'
+            template_name='users/password_reset_form.html',
+            form_class=PasswordReset,
         ),
         name='password_reset'
     ),
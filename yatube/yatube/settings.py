@@ -46,11 +46,14 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'jobs.apps.JobsConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -137,6 +140,13 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 STATIC_URL = '/static/'
 
+# collectstatic собирает сюда статику с хэшем содержимого в именах и
+# сжатыми копиями, а core.middleware.StaticFilesMiddleware её отдаёт.
+# Файлы без хэша в имени браузер кэширует на STATIC_CACHE_MAX_AGE секунд.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+STATIC_CACHE_MAX_AGE = 60 * 60
+
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -153,8 +163,120 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+# Двухуровневый кэш: небольшой LRU в памяти процесса перед общим для
+# всех воркеров хоста кэшем в отображённом в память файле. Каталог
+# файла создаётся с правами 0700, тесты держат кэш во временном каталоге
+# (core.runner.TestRunner).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.tiered.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 512,
+            # Как часто (в секундах) L1 сверяет штамп ключа с L2: запись
+            # другого воркера видна не позже чем через столько.
+            'CHECK_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.shared.SharedMemoryCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'shared.cache'),
+        'OPTIONS': {
+            'SLOTS': 4096,
+            'SLOT_SIZE': 65536,
+        },
+    },
 }
+
+
+TEST_RUNNER = 'core.runner.TestRunner'
+
+# Режим пагинации списков постов: 'page' (?page=N) или 'cursor'
+# (keyset по pub_date и id, без COUNT(*) и OFFSET).
+POSTS_PAGINATION = 'page'
+POSTS_PER_PAGE = 10
+
+# Движок ленты подписок: 'timeline' (материализованная лента,
+# заполняется при публикации поста), 'merge' (слияние кэшированных
+# потоков авторов, только ?page=N) или 'join' (JOIN Follow и Post).
+POSTS_FOLLOW_FEED = 'timeline'
+# Сколько последних постов автора добавляется в ленту при подписке.
+POSTS_TIMELINE_BACKFILL = 1000
+# Длина кэшированного потока постов автора для движка 'merge'
+# и время его жизни в кэше (секунды).
+POSTS_AUTHOR_STREAM_SIZE = 500
+POSTS_AUTHOR_STREAM_TIMEOUT = 60 * 60
+
+# Время жизни закэшированных списков постов (секунды): страницы
+# сбрасываются сигналами при записи, поэтому его можно держать большим.
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+# Защита от «лавины» пересборок: коэффициент раннего пересчёта XFetch,
+# сколько секунд после истечения ещё можно отдавать старую копию и
+# на сколько берётся блокировка пересборки.
+POSTS_CACHE_XFETCH_BETA = 1.0
+POSTS_CACHE_STALE_TIMEOUT = 60 * 5
+POSTS_CACHE_LOCK_TIMEOUT = 30
+
+# Длина текста поста (в символах) в превью на страницах списков.
+POSTS_EXCERPT_LENGTH = 500
+
+# Писать в лог yatube.queries view, превысившие объявленный бюджет
+# запросов к БД (core.decorators.query_budget).
+QUERY_BUDGET_LOG = True
+
+# Фоновая очередь задач (python manage.py runworker): сколько задач
+# выполнять одновременно и где ('thread' или 'process'), как часто
+# опрашивать очередь (секунды), через сколько секунд молчания воркера
+# задача снова становится доступной, число попыток и начальная пауза
+# перед повтором, которая удваивается с каждой неудачей до предела.
+# Раз в JOBS_PRUNE_INTERVAL секунд воркер удаляет выполненные задачи
+# старше JOBS_KEEP_DONE и проваленные старше JOBS_KEEP_FAILED секунд.
+JOBS_WORKER_CONCURRENCY = 4
+JOBS_WORKER_POOL = 'thread'
+JOBS_POLL_INTERVAL = 1.0
+JOBS_VISIBILITY_TIMEOUT = 60 * 5
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 10
+JOBS_RETRY_BACKOFF_MAX = 60 * 60
+JOBS_PRUNE_INTERVAL = 60 * 10
+JOBS_KEEP_DONE = 60 * 60 * 24
+JOBS_KEEP_FAILED = 60 * 60 * 24 * 7
+
+# Подписчиков у автора, при котором раскладка нового поста по лентам
+# уходит в фоновую очередь, а не выполняется в запросе.
+POSTS_FANOUT_INLINE_LIMIT = 100
+
+# Ширины вариантов картинки поста (кадр 960x339) для srcset, ширина
+# картинки в карточке и атрибут sizes для браузера.
+POSTS_IMAGE_WIDTHS = (480, 960, 1440)
+POSTS_IMAGE_WIDTH = 960
+POSTS_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+# Сколько секунд gc_media и collect_orphans ждут, прежде чем удалить
+# файл картинки, на который не осталось ссылок: за это время его может
+# подхватить повторная загрузка той же картинки.
+MEDIA_GC_GRACE = 60 * 60 * 24
+
+# Сколько файлов в секунду collect_orphans удаляет или переносит в
+# карантин, чтобы не мешать работающему серверу (0 — без ограничения).
+MEDIA_GC_RATE = 50
+
+# Отдача медиафайлов (core.media.serve). Если задан MEDIA_SENDFILE
+# ('X-Sendfile' для Apache и lighttpd или 'X-Accel-Redirect' для nginx),
+# файл отдаёт веб-сервер; для nginx он ищется во внутреннем location
+# MEDIA_ACCEL_REDIRECT_LOCATION, смотрящем в MEDIA_ROOT. Файлы с хэшем
+# в имени кэшируются браузером на год, остальные — на
+# MEDIA_CACHE_MAX_AGE секунд.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_LOCATION = '/internal-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
+# Сжатие ответов gzip (core.middleware.CompressionMiddleware): уровень
+# zlib от 1 до 9 и размер тела в байтах, с которого сжатие окупается.
+GZIP_LEVEL = 6
+GZIP_MIN_LENGTH = 1024
+
+# Начиная со скольких комментариев страница поста отдаётся потоком:
+# пост сразу, комментарии — порциями по POSTS_STREAM_COMMENTS_CHUNK.
+POSTS_STREAM_COMMENTS_THRESHOLD = 200
+POSTS_STREAM_COMMENTS_CHUNK = 100